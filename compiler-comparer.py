@@ -1,13 +1,29 @@
 #!/usr/bin/env python
 
+import collections;
 import concurrent.futures;
+import difflib;
+import fnmatch;
 import glob;
+import hashlib;
+import json;
 import os;
 from pathlib import Path;
+import posixpath;
+import queue;
+import re;
+import shutil;
+import signal;
+import socket;
+import statistics;
 import subprocess;
 import sys;
+import tarfile;
+import tempfile;
+import threading;
 import time;
 import traceback;
+import zipfile;
 
 
 # Check for '--debug' before we parse anything else, since we may want to debug the parsing itself.
@@ -33,23 +49,106 @@ if DEBUGGING: print("    >> CURRENT_DIR = '" + str(CURRENT_DIR) + "'");
 IS_WINDOWS = os.name == "nt";
 if DEBUGGING: print("    >> IS_WINDOWS = '" + str(IS_WINDOWS) + "'");
 
-# Every `REPACK_COUNTER_MAX` cycles, we want to repack and garbage collect in our scratch repository.
-# When using back-track, it's important to do this periodically, or otherwise the size of the repo
-# grows out of control and slows stuff down. (This only has an effect during back-tracking).
-REPACK_COUNTER_MAX = 100;
+# After each branch, we check how many loose objects and packs have built up in our scratch repository.
+# If we let them grow out of control, the repository gets huge and slows everything down, so once there are more than
+# `REPACK_PACKS_MAX` packs (every 'git fast-import' writes a new one, see `storeGeneratedCode`), we merge the smaller packs
+# together. We never write loose objects ourselves, but in case anything else does (like committing into the repository by hand),
+# once there are more than `REPACK_LOOSE_OBJECTS_MAX` of them, we pack them up too. Both of these are much cheaper than running
+# a full 'git gc', since they only touch the objects which were written recently (see `git_maintain`).
+REPACK_LOOSE_OBJECTS_MAX = 1000;
+REPACK_PACKS_MAX = 50;
 
+# These are the paths (relative to the repository root) that the Slice compilers are built from, on top of each compiler's
+# own 'cpp/src/<compiler>' directory. If none of them change between two commits, the compilers built from them will be
+# identical, which is what allows us to re-use previously built compilers from the build cache (see `--build-cache`).
+COMPILER_DEPENDENCIES = ["Makefile", "config", "cpp/Makefile", "cpp/config", "cpp/include", "cpp/msbuild", "cpp/src/Ice", "cpp/src/IceUtil", "cpp/src/Slice"];
 
+# The default size limit (in megabytes) of the build cache. Once it grows past this, the least recently used compilers are evicted.
+BUILD_CACHE_SIZE_DEFAULT = 2048;
 
+# These compilers generate files which are shared between multiple Slice files (like the '__init__.py' files of 'slice2py'),
+# so we can't tell which of their generated files came from which Slice file. All the other compilers generate files named
+# after the Slice file they were generated from (ie. 'Foo.ice' -> 'Foo.h' and 'Foo.cpp').
+SHARED_OUTPUT_COMPILERS = ["slice2py", "slice2java", "slice2matlab"];
 
+# The maximum number of characters that we allow a batch of Slice files to take up on the command line (see `--batch`).
+# Windows limits the entire command line to 8191 characters, so we leave plenty of room for the rest of the arguments.
+BATCH_LENGTH_MAX = 6000 if IS_WINDOWS else 100000;
 
+# Matches the '#include' directives in a Slice file. We only need the name of the included file.
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE);
 
+# Worktrees can store compilers into the build cache at the same time, so we serialize access to it with this lock.
+BUILD_CACHE_LOCK = threading.Lock();
 
+# We remember how long each compiler took to compile each Slice file (see `COMPILE_STATS`), so that the next time we compile it,
+# we can start the slowest jobs first. Each new measurement is averaged with the previous one using this weight, so that a single
+# slow run (because the machine was busy) doesn't throw off our estimates. Compiler jobs record their durations at the same time,
+# so we serialize access to these with this lock.
+COMPILE_STATS_WEIGHT = 0.5;
+COMPILE_STATS_LOCK = threading.Lock();
 
-def runCommand(args, desc, checked, capture):
-    if capture:
-        result = subprocess.run(args, check=checked, env=ENVIRONMENT, shell=IS_WINDOWS, capture_output=True);
+# When `--report` is enabled, 'runCommand' records how long each command took (and how much CPU time and memory it used) into
+# whichever list is stored in 'REPORT_CONTEXT.commands'. Each thread has its own list, since they each work on different things.
+REPORT_CONTEXT = threading.local();
+
+# How many of the slowest compilers and Slice files we print out at the end of the run when `--report` is enabled.
+REPORT_SUMMARY_COUNT = 10;
+
+# How many seconds the coordinator and workers wait between checks of the job queue (see `--coordinator` and `--worker`).
+QUEUE_POLL_INTERVAL = 1;
+
+# While a worker is building a job, it touches the job's file in the 'claimed' folder every `QUEUE_HEARTBEAT_INTERVAL` seconds.
+# If a claimed job isn't touched for `QUEUE_CLAIM_TIMEOUT` seconds, the coordinator assumes its worker was killed (or crashed without
+# cleaning up after itself), and puts the job back in the queue, so another worker can pick it up instead.
+QUEUE_HEARTBEAT_INTERVAL = 10;
+QUEUE_CLAIM_TIMEOUT = 120;
+
+# Test Slice files that we skip by default, unless they're specifically included with `--include` (see `resolveSliceFiles`).
+DEFAULT_SLICE_EXCLUDES = ["cpp/test/Slice/*", "java/test/Ice/*", "java-compat/test/Ice/*"];
+
+# The maximum number of commits that we look up with a single `git log` command (see `prefetchCommitInfo`).
+COMMIT_BATCH_SIZE = 100;
+
+# The temporary ref that 'git fast-import' writes each new commit onto, before we advance the scratch repository's branch.
+IMPORT_REF = "refs/compiler-comparer/import";
+
+# Git fails straight away if another git process is holding one of its lock files (like 'index.lock'), and on Windows, files can't be
+# deleted or moved while anything else has them open (like a compiler that's still exiting, or an anti-virus scanner). These only last
+# for a moment, so instead of waiting before every operation just in case, we retry any operation that fails because of them,
+# waiting a little longer each time. These are how many seconds we wait before each retry (see `retryOnLockErrors`).
+LOCK_RETRY_DELAYS = [0.05, 0.1, 0.2, 0.4, 0.8, 1.6];
+
+# Matches git's error messages which mean that it failed because of a lock. These are the only git failures that we retry.
+# Windows reports files that are still open as 'Permission denied', but only when git fails to delete them ('unable to unlink').
+# Any other permission error (like an unwritable directory, or a failed login when fetching) is real, so we don't retry it.
+LOCK_ERROR_PATTERN = re.compile(r"\.lock': File exists|unable to unlink .*Permission denied|being used by another process");
+
+# How many seconds we wait between checks for new commits on the branch we're watching, unless specified otherwise (see `--watch`).
+WATCH_POLL_INTERVAL_DEFAULT = 60;
+
+# The identity that commits in the scratch repository are committed under (the author is taken from the original commit).
+SCRATCH_COMMITTER = "temp <temp@zeroc.com>";
+
+
+
+
+
+
+
+
+def runCommand(args, desc, checked, capture, cwd=None):
+    commands = getattr(REPORT_CONTEXT, "commands", None);
+    if commands != None:
+        startTime = time.perf_counter();
+        (result, cpuTime, maxRss) = runMeasuredProcess(args, capture, cwd);
+        commands.append({"command": desc if desc != None else " ".join(args), "wall": time.perf_counter() - startTime, "cpu": cpuTime, "maxRss": maxRss});
+        if checked:
+            result.check_returncode();
+    elif capture:
+        result = subprocess.run(args, check=checked, env=ENVIRONMENT, shell=IS_WINDOWS, capture_output=True, cwd=cwd);
     else:
-        result = subprocess.run(args, check=checked, env=ENVIRONMENT, shell=IS_WINDOWS, stdout=OUTPUT_TO);
+        result = subprocess.run(args, check=checked, env=ENVIRONMENT, shell=IS_WINDOWS, stdout=OUTPUT_TO, cwd=cwd);
 
     if DEBUGGING:
         if desc == None: desc = " ".join(args);
@@ -60,7 +159,64 @@ def runCommand(args, desc, checked, capture):
     else:
         return None;
 
+# Runs a process the same way 'runCommand' does, but also measures how much CPU time it used, and its peak memory usage (in KiB).
+# To get these, we have to reap the process ourselves with `os.wait4`, which isn't available on Windows, so there they're `None`.
+def runMeasuredProcess(args, capture, cwd):
+    if IS_WINDOWS:
+        if capture:
+            return (subprocess.run(args, env=ENVIRONMENT, shell=True, capture_output=True, cwd=cwd), None, None);
+        else:
+            return (subprocess.run(args, env=ENVIRONMENT, shell=True, stdout=OUTPUT_TO, cwd=cwd), None, None);
 
+    process = subprocess.Popen(args, env=ENVIRONMENT, stdout=(subprocess.PIPE if capture else OUTPUT_TO), stderr=(subprocess.PIPE if capture else None), cwd=cwd);
+    try:
+        # Read 'stderr' on a separate thread, so the process can't deadlock by filling up one pipe while we're reading the other.
+        (stdout, stderr) = (None, [None]);
+        if capture:
+            reader = threading.Thread(target=lambda: stderr.__setitem__(0, process.stderr.read()));
+            reader.start();
+            stdout = process.stdout.read();
+            reader.join();
+        (_, status, usage) = os.wait4(process.pid, 0);
+        process.returncode = os.waitstatus_to_exitcode(status);
+    except BaseException:
+        process.kill();
+        process.wait();
+        raise;
+    finally:
+        for pipe in [process.stdout, process.stderr]:
+            if pipe != None: pipe.close();
+
+    # 'ru_maxrss' is measured in bytes on macOS, but in kilobytes everywhere else.
+    maxRss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss;
+    return (subprocess.CompletedProcess(args, process.returncode, stdout, stderr[0]), usage.ru_utime + usage.ru_stime, maxRss);
+
+
+
+# Calls 'function' with 'args', and if it fails because of a lock (see `LOCK_RETRY_DELAYS`), waits a moment and tries again.
+# Python only fails because of locks on Windows (with a 'PermissionError'), so we don't retry those anywhere else.
+def retryOnLockErrors(function, *args):
+    for delay in LOCK_RETRY_DELAYS + [None]:
+        try:
+            return function(*args);
+        except PermissionError:
+            if (delay == None) or not IS_WINDOWS:
+                raise;
+        except subprocess.CalledProcessError as ex:
+            errorOutput = (ex.stderr or b"").decode("utf-8", errors="replace");
+            if (delay == None) or (LOCK_ERROR_PATTERN.search(errorOutput) == None):
+                raise;
+        if DEBUGGING: print("    >> Failed because of a lock, retrying in " + str(delay) + " seconds");
+        time.sleep(delay);
+
+# Runs a git command, retrying it if it fails because of a lock. We have to capture git's output to check for these errors,
+# so if the command still fails, we print git's errors ourselves, since they wouldn't be shown otherwise.
+def runGitCommand(args, desc):
+    try:
+        retryOnLockErrors(runCommand, args, desc, True, True);
+    except subprocess.CalledProcessError as ex:
+        print((ex.stderr or b"").decode("utf-8", errors="replace").strip());
+        raise;
 
 def printHelp():
     print(
@@ -70,8 +226,12 @@ python compiler-comparer.py [options] [slice_files...]
 
 'slice_files' should be separated by spaces and can be either individual files or directories.
 If a file is provided it is passed directly to the Slice compilers (and should end with '.ice').
-If a directory is provided, this script will recursively search for all files ending with '.ice'
-within the directory and compile them.
+If a directory is provided, this script will compile all the files ending with '.ice' within the
+directory (recursively) that are tracked by git.
+
+The generated code for each branch is committed into a git repository in the '_slice_compare_'
+directory. Each commit also has a 'CHANGES.json' file, which lists the files that changed since
+the previous commit (and by how many bytes), grouped by compiler.
 
 OPTIONS:
 -c, --compiler     Specifies a slice compiler that this script should run over Slice files.
@@ -108,6 +268,11 @@ OPTIONS:
                    If `--catchup` is specified it is invalid to also provide specific branches with
                    `--branch`, or to use `--back-track`. Only one of these may be used at a time.
 
+--ancestry-path    When catching up or watching, compare every commit that descends from the last
+                   compared commit (including commits that were merged in from other branches),
+                   instead of only following the first parent of merge commits. Only valid with
+                   `--catchup` or `--watch`.
+
 --proj-path        Specifies the project file path that should be used to build the compilers.
                    It shouldn't be necessary to set this if you're inside the repository,
                    the script should be able to find `cpp/msbuild/ice.proj` automatically.
@@ -123,10 +288,144 @@ OPTIONS:
 
 -p, --parallel     Instructs the script to build and run the Slice compilers in parallel.
                    You probably want this turned on.
-                   Note: 'slice2java', 'slice2py', and 'slice2matlab' are always run serially due
-                   to race conditions in how they generate directories and shared files.
-                   But all other compilers will be run in parallel, even if used alongside one of
-                   the above, and the building of the compilers themselves will also be in parallel.
+                   Note: 'slice2java', 'slice2py', and 'slice2matlab' race with themselves when
+                   generating directories and shared files. So when run in parallel, each of
+                   their processes writes into a private scratch directory, and the results are
+                   merged together afterwards (in the same order they'd be generated serially).
+                   The building of the compilers themselves will also be in parallel.
+
+-j, --jobs         Specifies how many Slice compilers (and build jobs) can run at the same time.
+                   This implies `--parallel`. If it isn't specified, the script runs one Slice
+                   compiler per CPU core, and lets 'make' or 'msbuild' decide when building.
+                   For example: `--jobs=16`.
+                   All the compilers are run at the same time (not one compiler after another),
+                   and the slowest Slice files (timed in previous runs) are started first.
+
+--worktrees        Instructs the script to build and generate code for multiple branches at once.
+                   Each branch is given its own 'git worktree' (with its own object files and
+                   compilers), and up to N of these worktrees are built at the same time.
+                   The results are still stored in '_slice_compare_' in the order the branches
+                   were provided. For example: `--worktrees=4` builds 4 commits at a time.
+                   Worktrees are created under '_slice_worktrees_' and removed once finished.
+
+--build-cache      Instructs the script to cache the compilers it builds, and re-use them whenever
+                   nothing they're built from has changed, instead of re-building them.
+                   Compilers are cached by the git tree hashes of their 'cpp/src/<compiler>'
+                   directory, 'cpp/src/Slice', and the build files (see 'COMPILER_DEPENDENCIES').
+                   The cache is stored under '_slice_cache_', which is never cleaned by the script.
+                   Cached compilers are checked to still run (with `--version`) before re-use.
+
+--build-cache-size Specifies the maximum size of the build cache in megabytes (default is 2048).
+                   When the cache grows past this, the least recently used compilers are evicted.
+                   For example: `--build-cache-size=512`.
+
+--skip-unchanged   Instructs the script to skip building and generating code for any branch where
+                   neither the sources of the compilers, or any Slice files (even ones that aren't
+                   being compiled, since they could be included), have changed since the previous
+                   branch (the generated code would be identical).
+                   An empty commit is still recorded in '_slice_compare_' for each skipped branch,
+                   so `--catchup` knows which commits have already been compared.
+
+--incremental      Instructs the script to only re-compile the Slice files which have changed (or
+                   which include a file that changed, directly or transitively) since the previous
+                   branch. The code generated for the rest of the Slice files is re-used from the
+                   previous branch's results in '_slice_compare_'. If a compiler itself changed,
+                   all the Slice files are re-compiled with it.
+                   The include graph is cached under '_slice_cache_' between branches and runs.
+                   It is invalid to use `--incremental` with `--worktrees`.
+
+--batch            Instructs the script to compile many Slice files with a single compiler process,
+                   instead of starting a new process for every Slice file. Files are batched
+                   together by the directory they live in (which determines their output and
+                   include directories), and diagnostics are split back up between the files.
+                   If a batch fails to compile, its files are re-compiled one at a time.
+
+--unordered-diagnostics
+                   Diagnostics are always printed as soon as each compiler finishes, and they're
+                   streamed into the 'DIAGNOSTICS' file as they're produced. But by default, they
+                   are written into that file in a deterministic order (the order the files would
+                   be compiled in serially), so it doesn't change between branches for no reason.
+                   This option writes them into the file in the order they finish in instead.
+
+--staging-dir      Generate code into the specified directory, instead of the repository's working
+                   tree. Each branch's generated code is deleted as soon as it has been stored.
+                   Passing 'ram' uses '/dev/shm' (or the system's temporary directory if there's
+                   no '/dev/shm'), so generated files never touch the disk before being stored.
+
+--report           Record how long each phase of every branch took, along with the wall time, CPU
+                   time, and peak memory usage of every command (including every compiler run).
+                   A JSON report is written for each commit, along with a CSV of every compiler run
+                   and a summary of the slowest compilers and Slice files. These are stored in
+                   '_slice_report_' by default, or in the directory given by `--report=<dir>`.
+
+--benchmark        After generating code for a branch, run each compiler over all the Slice files
+                   this many more times, and store the fastest and median wall time, and the peak
+                   memory usage in a 'BENCHMARK.json' file next to the 'DIAGNOSTICS' file.
+                   For example: `--benchmark=5`.
+
+--benchmark-threshold
+                   Fail the run if any compiler's median wall time or peak memory usage grows by
+                   more than this percentage between two branches. For example:
+                   `--benchmark-threshold=10`.
+
+--resume           Resume the last run, if it was cancelled or crashed before finishing. The same
+                   branches are compared (skipping any that were already finished) with the same
+                   compilers and Slice files, unless others are specified. Implies `--build-cache`.
+
+--bisect           Instead of comparing branches, binary-search through the commits in the range
+                   '<good>..<bad>' for the first commit that changed the generated code, and print
+                   out which files it changed. For example: `--bisect=v3.7.0..main`.
+
+--bisect-path      Only look at generated files which match this glob when bisecting. Paths start
+                   with the compiler's name. For example: `--bisect-path=slice2cs/*/Ice/Router.cs`.
+
+--coordinator      Instead of building branches itself, hand them out to workers through a queue in
+                   the specified directory, and store their results in order like usual. The
+                   directory must be shared with all the workers. For example:
+                   `--coordinator=/mnt/queue`.
+
+--worker           Build whatever branches the coordinator puts in the queue in the specified
+                   directory, until the coordinator is finished. Each worker needs its own copy
+                   of the repository. For example: `--worker=/mnt/queue`.
+
+--incremental-build
+                   Keep the object files (and other build outputs) between branches, instead of
+                   deleting everything before each build, so the compilers are built incrementally.
+
+--include          Only compile the Slice files which match this glob (relative to the repository).
+                   Can be specified multiple times. For example: `--include=slice/Ice/*`.
+
+--exclude          Don't compile any Slice files which match this glob (relative to the repository).
+                   Can be specified multiple times. For example: `--exclude=*/test/*`.
+
+--aggressive-gc    Run a full `git gc --aggressive` on the '_slice_compare_' repository at the end
+                   of the run, to pack it as tightly as possible. This can take a very long time.
+
+--diff-only        Instead of storing the generated code in '_slice_compare_', compare the code
+                   generated by exactly two branches directly, and write a report of their
+                   differences (with a unified diff of every changed file) into '_slice_diff_'.
+                   Exits with code 33 if the generated code differs.
+                   For example: `-b=main -b=my-feature --diff-only`.
+
+--watch            Keep running, and whenever new commits show up on the specified branch, compare
+                   them (the same as `--catchup` would). If it's a remote-tracking branch, its
+                   remote is fetched before every check. Implies `--build-cache`. For example:
+                   `--watch=origin/main`.
+
+--poll-interval    How many seconds to wait between checks for new commits when using `--watch`.
+                   Defaults to 60 seconds. For example: `--poll-interval=300`.
+
+--yes              Don't ask for confirmation before cleaning the repository (for running
+                   unattended).
+
+--storage          Where to store the generated code: 'git' (the default) stores it in the
+                   '_slice_compare_' repository, and 'archive' stores it in a zip file per compiler
+                   per commit, in the '_slice_archive_' directory. For example: `--storage=archive`.
+
+--query            Print the history of a generated file from the '_slice_archive_' directory,
+                   without building anything. With one branch, print the file for that commit, and
+                   with two, print a diff of the file between them. For example:
+                   `--query=slice2cpp/slice/Ice/Router.h`.
 '''
     );
 
@@ -141,39 +440,64 @@ OPTIONS:
 #### Define Functions for the Actual Runtime Logic ####
 #### ============================================= ####
 
-def git_clean(fullClean):
-    time.sleep(0.1);
+# If 'keepIgnored' is true, files that git ignores (like object files and other build outputs) are kept, so builds can be incremental.
+def git_clean(fullClean, directory=".", keepIgnored=False):
     try:
-        args = ["git", "clean", "-dqfx"] + ([] if fullClean else ["-e", "_slice_compare_"]);
-        runCommand(args, None, checked=True, capture=False);
+        args = ["git", "-C", directory, "clean", "-dqf" if keepIgnored else "-dqfx", "-e", "_slice_worktrees_", "-e", "_slice_cache_", "-e", "_slice_report_", "-e", "_slice_diff_", "-e", "_slice_archive_"] + ([] if fullClean else ["-e", "_slice_compare_"]);
+        runGitCommand(args, "git -C ... clean ...");
     except subprocess.CalledProcessError as ex:
         print(ex);
         print("WARNING: failed to 'git clean' repository, continuing anyways...");
         print();
 
 def git_reset():
-    time.sleep(0.1);
     try:
-        runCommand(["git", "reset", "--hard"], None, checked=True, capture=False);
+        runGitCommand(["git", "reset", "--hard"], None);
     except subprocess.CalledProcessError as ex:
         print(ex);
         print("WARNING: failed to 'git reset' repository, continuing anyways...");
         print();
 
-def git_checkout(branchName):
-    time.sleep(0.1);
-    runCommand(["git", "-c", "advice.detachedHead=false", "checkout", branchName], "git ... checkout ...", checked=True, capture=False);
-
-def git_repack(directory):
+def git_checkout(branchName, directory="."):
+    # Worktrees cannot checkout a branch that's already checked out somewhere else, so we always detach inside of them.
+    detach = ["--detach"] if directory != "." else [];
+    runGitCommand(["git", "-C", directory, "-c", "advice.detachedHead=false", "checkout"] + detach + [branchName], "git ... checkout ...");
+
+# Checks how many loose objects and packs have built up in the repository, and packs them up if there's more than we allow.
+# Instead of rewriting the entire repository like 'git gc' does, loose objects are packed into a new pack, and packs are merged
+# with `--geometric`, which only rewrites the smallest packs. Whenever we repack, we also write a multi-pack-index and commit-graph,
+# so git can still look things up quickly, no matter how many packs are left. If 'force' is true, we always pack any loose objects.
+def git_maintain(directory, force=False):
+    objectCounts = {};
+    for line in runCommand(["git", "-C", directory, "count-objects", "-v"], "git -C ... count-objects -v", checked=True, capture=True).splitlines():
+        (key, _, value) = line.partition(":");
+        if value.strip().isdigit():
+            objectCounts[key.strip()] = int(value.strip());
+    if DEBUGGING: print("    >> objectCounts = '" + str(objectCounts) + "'");
+
+    repacked = False;
+    if objectCounts.get("count", 0) > (0 if force else REPACK_LOOSE_OBJECTS_MAX):
+        print("packing " + str(objectCounts["count"]) + " loose objects...");
+        runCommand(["git", "-C", directory, "repack", "-d", "-q"], "git -C ... repack -d", checked=True, capture=False);
+        objectCounts["packs"] = objectCounts.get("packs", 0) + 1;
+        repacked = True;
+    if objectCounts.get("packs", 0) > REPACK_PACKS_MAX:
+        print("merging " + str(objectCounts["packs"]) + " packs...");
+        runCommand(["git", "-C", directory, "repack", "-d", "-q", "--geometric=2"], "git -C ... repack -d --geometric=2", checked=True, capture=False);
+        repacked = True;
+
+    if repacked and objectCounts.get("packs", 0) > 0:
+        runCommand(["git", "-C", directory, "multi-pack-index", "write"], "git -C ... multi-pack-index write", checked=True, capture=False);
+        runCommand(["git", "-C", directory, "commit-graph", "write", "--reachable", "--split"], "git -C ... commit-graph write", checked=True, capture=False);
+
+# Runs a full (and very slow) garbage collection pass, which rewrites the entire repository into a single tightly packed pack.
+def git_gc(directory):
     print();
-    print("repacking repository and running garbage collection pass...");
-
-    time.sleep(0.1);
-    runCommand(["git", "-C", directory, "gc"], "git -C ... gc", checked=True, capture=False);
+    print("running an aggressive garbage collection pass (this can take a while)...");
+    runCommand(["git", "-C", directory, "gc", "--aggressive", "--prune=now", "--quiet"], "git -C ... gc --aggressive", checked=True, capture=False);
     print();
 
 def build(compilers, projPath):
-    time.sleep(0.1);
     if IS_WINDOWS:
         # We have to do a NuGet restore before building the Slice compilers.
         runCommand(["msbuild", projPath, "/t:NuGetRestore"], "NuGet Restore ...", checked=True, capture=False);
@@ -182,18 +506,199 @@ def build(compilers, projPath):
         slnPath = projPath.replace(".proj", ".sln");
         args = ["msbuild", slnPath, "/p:Configuration=Debug", "/p:Platform=x64", "/nr:false"];
         if runInParallel:
-            args.insert(1, "/m");
+            args.insert(1, "/m" if jobCount == None else "/m:" + str(jobCount));
         args += [("/t:" + Path(c).stem) for c in compilers];
         runCommand(args, "msbuild ...", checked=True, capture=False);
     else:
         args = ["make", "-C", os.path.dirname(projPath)] + [os.path.basename(c) for c in compilers];
         if runInParallel:
-            args.insert(1, "-j");
+            args.insert(1, "-j" if jobCount == None else "-j" + str(jobCount));
         runCommand(args, "make ...", checked=True, capture=False);
 
-def sliceCompile(compiler, sliceFile, outputDir):
-    parentDir = os.path.dirname(sliceFile);
-    args = [compiler, "--output-dir", outputDir, "-I./slice", "-I" + parentDir, "-I" + os.path.dirname(parentDir), sliceFile];
+# Computes the key that 'compiler' is stored under in the build cache, from the git tree hashes of everything it's built from.
+def getCompilerCacheKey(compiler, workDir):
+    compilerName = Path(compiler).stem;
+    dependencies = COMPILER_DEPENDENCIES + ["cpp/src/" + compilerName];
+    trees = runCommand(["git", "-C", workDir, "ls-tree", "HEAD", "--"] + dependencies, "git -C ... ls-tree HEAD -- ...", checked=True, capture=True);
+    return hashlib.sha1((compilerName + "\n" + sys.platform + "\n" + trees).encode("utf-8")).hexdigest();
+
+# If a copy of 'compiler' is stored in the build cache under 'key', copy it to where the compiler would've been built, and return true.
+# We only cache the compiler's executable, so if it's dynamically linked (like the 3.7 compilers, which need the libraries in 'cpp/lib'),
+# it won't be able to run after those libraries are cleaned away. So we check that it runs first, and if it doesn't, we evict it from
+# the cache and return false, so that it gets re-built (along with its libraries) instead.
+def restoreCachedCompiler(compiler, key, cacheDir):
+    entryDir = os.path.join(cacheDir, key);
+    cachedCompiler = os.path.join(entryDir, os.path.basename(compiler));
+    if not os.path.isfile(cachedCompiler):
+        return False;
+
+    Path(compiler).parent.mkdir(parents=True, exist_ok=True);
+    shutil.copy2(cachedCompiler, compiler);
+    try:
+        runCommand([compiler, "--version"], None, checked=True, capture=True);
+    except (OSError, subprocess.CalledProcessError):
+        print("    Cached " + Path(compiler).stem + " (" + key[:12] + ") failed to run, it will be re-built");
+        os.remove(compiler);
+        with BUILD_CACHE_LOCK:
+            shutil.rmtree(entryDir, ignore_errors=True);
+        return False;
+
+    # Bump the entry's modification time, this is how we track which entries were least recently used.
+    os.utime(entryDir);
+    return True;
+
+# Stores a freshly built 'compiler' in the build cache under 'key', then evicts the least recently used entries until the
+# cache fits within 'maxSize' (in bytes) again.
+def storeCachedCompiler(compiler, key, cacheDir, maxSize):
+    with BUILD_CACHE_LOCK:
+        entryDir = os.path.join(cacheDir, key);
+        if os.path.isdir(entryDir):
+            return;
+
+        # We copy the compiler into a temporary directory first, and then rename it, so that if we're cancelled halfway through
+        # copying, we're never left with a partial entry in the cache.
+        tempDir = entryDir + ".tmp";
+        shutil.rmtree(tempDir, ignore_errors=True);
+        Path(tempDir).mkdir(parents=True);
+        shutil.copy2(compiler, os.path.join(tempDir, os.path.basename(compiler)));
+        retryOnLockErrors(os.replace, tempDir, entryDir);
+
+        entries = [];
+        totalSize = 0;
+        for entry in os.scandir(cacheDir):
+            if entry.is_dir() and ".tmp" not in entry.name:
+                entrySize = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file());
+                entries.append((entry.stat().st_mtime, entrySize, entry.path));
+                totalSize += entrySize;
+        for (_, entrySize, entryPath) in sorted(entries):
+            if totalSize <= maxSize:
+                break;
+            if DEBUGGING: print("    >> Evicting '" + entryPath + "' from the build cache");
+            shutil.rmtree(entryPath, ignore_errors=True);
+            totalSize -= entrySize;
+
+# Returns the names of all the files that 'sliceFile' includes, exactly as they're written in its '#include' directives.
+def scanIncludes(sliceFile):
+    with open(sliceFile, "r", encoding="utf-8", errors="replace") as file:
+        return INCLUDE_PATTERN.findall(file.read());
+
+# Loads a JSON file from one of our caches, returning 'default' if the file doesn't exist (or can't be read).
+def loadJson(path, default):
+    try:
+        with open(path, "r") as file:
+            return json.load(file);
+    except (OSError, ValueError):
+        return default;
+
+# Stores 'value' into a JSON file. We write to a temporary file first so that we never leave a half-written file behind.
+def saveJson(path, value):
+    Path(path).parent.mkdir(parents=True, exist_ok=True);
+    with open(path + ".tmp", "w") as file:
+        json.dump(value, file);
+    retryOnLockErrors(os.replace, path + ".tmp", path);
+
+# Returns the ID that git would give to a file with the specified contents (without having to ask git for it).
+def hashGitBlob(data):
+    return hashlib.sha1(b"blob " + str(len(data)).encode() + b"\0" + data).hexdigest();
+
+# Returns a unified diff between two versions of a generated file, with the same headers that 'git diff' would write.
+# Either of the paths can be `None`, if the file was added or removed. This runs in a separate process (see `--diff-only`),
+# since 'difflib' is pure python, so it has to live at the top-level, where the process can find it.
+def diffGeneratedFile(path, oldPath, newPath):
+    contents = [];
+    for filePath in (oldPath, newPath):
+        if filePath == None:
+            contents.append(None);
+        else:
+            with open(filePath, "rb") as file:
+                contents.append(file.read());
+    return diffContents(path, contents[0], contents[1]);
+
+# Returns a unified diff between the 'oldData' and 'newData' of a generated file (either of which is `None` if the file doesn't exist).
+def diffContents(path, oldData, newData):
+    header = "diff --git a/" + path + " b/" + path + "\n";
+    if oldData == None:
+        header += "new file mode 100644\n";
+    elif newData == None:
+        header += "deleted file mode 100644\n";
+    contents = [(data if data != None else b"") for data in (oldData, newData)];
+    if (b"\0" in contents[0]) or (b"\0" in contents[1]):
+        return header + "Binary files " + ("a/" + path if oldData != None else "/dev/null") + " and " + ("b/" + path if newData != None else "/dev/null") + " differ\n";
+
+    (oldLines, newLines) = [c.decode("utf-8", errors="replace").splitlines(keepends=True) for c in contents];
+    diffLines = difflib.unified_diff(oldLines, newLines, "a/" + path if oldData != None else "/dev/null", "b/" + path if newData != None else "/dev/null");
+    return header + "".join(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n" for line in diffLines);
+
+# Loads the index of the archives in 'archiveDir' (see `--storage=archive`). It has one line for each commit that was archived (in order),
+# which holds which archive each compiler's generated code is stored in, and a hash of that code, so we can tell when it changed.
+def loadArchiveIndex(archiveDir):
+    try:
+        with open(os.path.join(archiveDir, "index.jsonl"), "r") as file:
+            return [json.loads(line) for line in file if line.strip() != ""];
+    except OSError:
+        return [];
+
+# Reads the generated file at 'path' for the archived commit 'entry', or returns `None` if it wasn't generated for that commit.
+# Each archive is a zip file, which has its own index of where every file is, so we only have to decompress the file we want.
+def readArchivedFile(archiveDir, entry, path):
+    archivePath = entry["archives"].get(path.split("/")[0]);
+    if archivePath == None:
+        return None;
+    with zipfile.ZipFile(os.path.join(archiveDir, archivePath), "r") as archive:
+        try:
+            return archive.read(path);
+        except KeyError:
+            return None;
+
+# Prints the generated file at 'path' from the archives in 'archiveDir'. If no commits are given, we print a diff for every archived
+# commit that changed the file. If one commit is given, we print the file as it was generated for that commit, and if two commits are
+# given, we print a diff of the file between them. Commits can be given by any prefix of their IDs. Returns whether they were all found.
+def queryArchive(archiveDir, path, commits):
+    entries = loadArchiveIndex(archiveDir);
+    if len(commits) == 0:
+        (previousEntry, previousData) = (None, None);
+        for entry in entries:
+            # If the compiler's archive didn't change, then none of its files did either, so there's no need to open it.
+            if (previousEntry != None) and (entry["archives"].get(path.split("/")[0]) == previousEntry["archives"].get(path.split("/")[0])):
+                continue;
+            data = readArchivedFile(archiveDir, entry, path);
+            if data != previousData:
+                print("==== " + entry["branch"] + " @ " + entry["commit"] + ": " + entry["subject"]);
+                sys.stdout.write(diffContents(path, previousData, data));
+            (previousEntry, previousData) = (entry, data);
+        return True;
+
+    foundEntries = [];
+    for commit in commits:
+        matches = [entry for entry in entries if entry["commit"].startswith(commit) or commit.startswith(entry["commit"])];
+        if len(matches) == 0:
+            print("ERROR: no generated code was archived for '" + commit + "'");
+            return False;
+        foundEntries.append(matches[-1]);
+
+    if len(foundEntries) == 1:
+        data = readArchivedFile(archiveDir, foundEntries[0], path);
+        if data == None:
+            print("ERROR: '" + path + "' wasn't generated for '" + commits[0] + "'");
+            return False;
+        sys.stdout.buffer.write(data);
+    else:
+        sys.stdout.write(diffContents(path, readArchivedFile(archiveDir, foundEntries[0], path), readArchivedFile(archiveDir, foundEntries[1], path)));
+    return True;
+
+# Returns how long it would take to run jobs that take 'durations' (in the order they're given) with 'workerCount' workers,
+# if each job is started on whichever worker becomes free first, the same as a thread pool would run them.
+def simulateMakespan(durations, workerCount):
+    workers = [0.0] * workerCount;
+    for duration in durations:
+        index = workers.index(min(workers));
+        workers[index] += duration;
+    return max(workers);
+
+# Returns the arguments to run 'compiler' over 'sliceFiles' with. All the files must live in the same directory.
+def getSliceCompileArgs(compiler, sliceFiles, outputDir):
+    parentDir = os.path.dirname(sliceFiles[0]);
+    args = [compiler, "--output-dir", outputDir, "-I./slice", "-I" + parentDir, "-I" + os.path.dirname(parentDir)] + sliceFiles;
 
     # Make sure to also check the generated typescript code if we're running 'slice2js'.
     compilerName = Path(compiler).stem;
@@ -202,19 +707,106 @@ def sliceCompile(compiler, sliceFile, outputDir):
 
     # Make sure the output directory exists. The Slice compilers cannot create directories that don't already exist.
     Path(outputDir).mkdir(parents=True, exist_ok=True);
+    return args;
+
+def sliceCompile(compiler, sliceFile, outputDir, workDir):
+    args = getSliceCompileArgs(compiler, [sliceFile], outputDir);
 
     # We set `checked=False` here to tolerate when the Slice compiler encounters errors. Otherwise one error kills this whole script.
-    result = runCommand(args, os.path.basename(compiler) + " ...", checked=False, capture=True);
+    result = runCommand(args, os.path.basename(compiler) + " ...", checked=False, capture=True, cwd=workDir);
     return (result + "\n" if result else result);
 
-def moveDir(sourceDir, destinationDir):
-    time.sleep(0.1);
-    if IS_WINDOWS:
-        # The 'move' command cannot move hidden directories, so we first must make sure the 'hidden' attribute is unset.
-        runCommand(["attrib", "-h", sourceDir], "move ...", checked=True, capture=False);
-        runCommand(["move", "/y", sourceDir, destinationDir], "move ...", checked=True, capture=False);
-    else:
-        runCommand(["mv", "-f", sourceDir, destinationDir], "mv ...", checked=True, capture=False);
+# Runs 'compiler' over a batch of Slice files (which must all live in the same directory) with a single process.
+# Returns a dictionary holding the diagnostics that were produced for each of the Slice files.
+def sliceCompileBatch(compiler, sliceFiles, outputDir, workDir):
+    if len(sliceFiles) == 1:
+        return {sliceFiles[0]: sliceCompile(compiler, "./" + sliceFiles[0], outputDir, workDir)};
+
+    args = getSliceCompileArgs(compiler, ["./" + f for f in sliceFiles], outputDir);
+    try:
+        result = runCommand(args, os.path.basename(compiler) + " ...", checked=True, capture=True, cwd=workDir);
+    except subprocess.CalledProcessError:
+        # If any of the files failed to compile, the compiler might've stopped without compiling the rest of the batch.
+        # So we fall back to compiling the files one at a time, which also gives us their exact diagnostics.
+        if DEBUGGING: print("    >> Batch failed, falling back to compiling '" + str(sliceFiles) + "' one at a time");
+        return {f: sliceCompile(compiler, "./" + f, outputDir, workDir) for f in sliceFiles};
+
+    # Split the output back up between the Slice files. Each diagnostic starts with the path of the file it's about, and any
+    # lines that don't (like notes and context for the previous diagnostic) belong to whichever file the previous line did.
+    lines = {f: [] for f in sliceFiles};
+    currentFile = sliceFiles[0];
+    for line in result.splitlines():
+        currentFile = next((f for f in sliceFiles if line.startswith("./" + f + ":") or line.startswith(f + ":")), currentFile);
+        lines[currentFile].append(line);
+    return {f: ("\n".join(lines[f]) + "\n" if lines[f] else "") for f in sliceFiles};
+
+# Moves all the files that were generated into 'scratchDir' over to 'outputDir'. Files which already exist in 'outputDir' are
+# overwritten, just like they would be if the files had been generated there directly. Except for "__init__.py" files, which
+# the compilers update instead of overwriting, so we merge these, to get exactly what the compilers would've generated.
+def mergeScratchDir(scratchDir, outputDir):
+    for (dirPath, _, fileNames) in os.walk(scratchDir):
+        destinationDir = os.path.join(outputDir, os.path.relpath(dirPath, scratchDir));
+        Path(destinationDir).mkdir(parents=True, exist_ok=True);
+        for fileName in fileNames:
+            source = os.path.join(dirPath, fileName);
+            destination = os.path.join(destinationDir, fileName);
+            if fileName == "__init__.py" and os.path.isfile(destination):
+                mergeInitFile(source, destination);
+            else:
+                retryOnLockErrors(os.replace, source, destination);
+
+# Merges the lines of the "__init__.py" file at 'source' into the one at 'destination'.
+# Lines that only exist in 'source' are added after the lines that surround them in 'destination'. Since these files
+# are just lists of imports, this is the same as what the compiler does when it updates an existing "__init__.py" file.
+def mergeInitFile(source, destination):
+    with open(destination, "rb") as file:
+        destinationLines = file.read().splitlines(keepends=True);
+    with open(source, "rb") as file:
+        sourceLines = file.read().splitlines(keepends=True);
+
+    mergedLines = [];
+    matcher = difflib.SequenceMatcher(None, destinationLines, sourceLines, autojunk=False);
+    for (tag, i1, i2, j1, j2) in matcher.get_opcodes():
+        mergedLines.extend(destinationLines[i1:i2]);
+        if tag == "replace" or tag == "insert":
+            mergedLines.extend(line for line in sourceLines[j1:j2] if line not in destinationLines);
+
+    with open(destination, "wb") as file:
+        file.write(b"".join(mergedLines));
+
+# Splits a list of Slice files into batches that can each be compiled by a single compiler process.
+# Files can only be batched together if they live in the same directory, since that determines their output directory and
+# include directories. We also cap the length of each batch, so we don't run into command-line length limits on Windows.
+def getSliceFileBatches(sliceFiles):
+    batches = {};
+    for file in sliceFiles:
+        batchList = batches.setdefault(os.path.dirname(file), [[]]);
+        if sum(len(f) + 3 for f in batchList[-1]) + len(file) > BATCH_LENGTH_MAX:
+            batchList.append([]);
+        batchList[-1].append(file);
+    return [batch for batchList in batches.values() for batch in batchList if len(batch) != 0];
+
+def git_worktree_add(worktreeDir):
+    runGitCommand(["git", "worktree", "add", "--detach", worktreeDir], "git worktree add ...");
+
+def git_worktree_remove(worktreeDir):
+    try:
+        runGitCommand(["git", "worktree", "remove", "--force", worktreeDir], "git worktree remove ...");
+    except subprocess.CalledProcessError as ex:
+        print(ex);
+        print("WARNING: failed to remove worktree '" + worktreeDir + "', continuing anyways...");
+        print();
+
+# Returns the equivalent of 'path' inside of 'rootDir', where 'rootDir' is a worktree of the repository.
+# Paths which don't live inside of the repository are returned unchanged.
+def rebasePath(path, rootDir, repoRoot):
+    sanitizedRepoRoot = repoRoot.replace('\\', '/') + '/';
+    sanitizedPath = os.path.abspath(path).replace('\\', '/');
+    if sanitizedPath + '/' == sanitizedRepoRoot:
+        return rootDir;
+    if sanitizedPath.startswith(sanitizedRepoRoot):
+        return os.path.join(rootDir, sanitizedPath[len(sanitizedRepoRoot):]);
+    return path;
 
 
 
@@ -236,6 +828,34 @@ if __name__ == "__main__":
     projPath = "";
     compilersPath = "";
     runInParallel = False;
+    jobCount = None;
+    worktreeCount = None;
+    useBuildCache = False;
+    skipUnchanged = False;
+    incremental = False;
+    batchCompile = False;
+    orderedDiagnostics = True;
+    stagingDir = None;
+    reportDir = None;
+    benchmarkRuns = None;
+    benchmarkThreshold = None;
+    resume = False;
+    ancestryPath = False;
+    bisectRange = None;
+    bisectPath = "*";
+    coordinatorQueueDir = None;
+    workerQueueDir = None;
+    incrementalBuild = False;
+    includePatterns = [];
+    excludePatterns = [];
+    aggressiveGc = False;
+    diffOnly = False;
+    watchBranch = None;
+    pollInterval = None;
+    assumeYes = False;
+    storage = "git";
+    queryPath = None;
+    buildCacheSize = BUILD_CACHE_SIZE_DEFAULT;
 
     # Define all the command-line switches for specifying parameters.
     SHORT_COMPILER = "-c=";
@@ -248,6 +868,36 @@ if __name__ == "__main__":
     COMPILERS_PATH = "--compilers-path=";
     SHORT_PARALLEL = "-p";
     LONG_PARALLEL = "--parallel";
+    SHORT_JOBS = "-j=";
+    LONG_JOBS = "--jobs=";
+    WORKTREES = "--worktrees=";
+    BUILD_CACHE = "--build-cache";
+    SKIP_UNCHANGED = "--skip-unchanged";
+    INCREMENTAL = "--incremental";
+    BATCH = "--batch";
+    UNORDERED_DIAGNOSTICS = "--unordered-diagnostics";
+    STAGING_DIR = "--staging-dir=";
+    BENCHMARK = "--benchmark=";
+    BENCHMARK_THRESHOLD = "--benchmark-threshold=";
+    RESUME = "--resume";
+    ANCESTRY_PATH = "--ancestry-path";
+    BISECT = "--bisect=";
+    BISECT_PATH = "--bisect-path=";
+    INCREMENTAL_BUILD = "--incremental-build";
+    INCLUDE = "--include=";
+    EXCLUDE = "--exclude=";
+    AGGRESSIVE_GC = "--aggressive-gc";
+    DIFF_ONLY = "--diff-only";
+    WATCH = "--watch=";
+    POLL_INTERVAL = "--poll-interval=";
+    YES = "--yes";
+    STORAGE = "--storage=";
+    QUERY = "--query=";
+    COORDINATOR = "--coordinator=";
+    WORKER = "--worker=";
+    REPORT = "--report";
+    REPORT_DIR = "--report=";
+    BUILD_CACHE_SIZE = "--build-cache-size=";
     LONG_DEBUGGING = "--debug";
 
     # Parse any command line arguments.
@@ -280,6 +930,98 @@ if __name__ == "__main__":
         elif arg == SHORT_PARALLEL or arg == LONG_PARALLEL:
             runInParallel = True;
             if DEBUGGING: print("    >> Turning 'runInParallel' on because of '" + arg + "'");
+        elif arg == BUILD_CACHE:
+            useBuildCache = True;
+            if DEBUGGING: print("    >> Turning 'useBuildCache' on because of '" + arg + "'");
+        elif arg == SKIP_UNCHANGED:
+            skipUnchanged = True;
+            if DEBUGGING: print("    >> Turning 'skipUnchanged' on because of '" + arg + "'");
+        elif arg == INCREMENTAL:
+            incremental = True;
+            if DEBUGGING: print("    >> Turning 'incremental' on because of '" + arg + "'");
+        elif arg == BATCH:
+            batchCompile = True;
+            if DEBUGGING: print("    >> Turning 'batchCompile' on because of '" + arg + "'");
+        elif arg == UNORDERED_DIAGNOSTICS:
+            orderedDiagnostics = False;
+            if DEBUGGING: print("    >> Turning 'orderedDiagnostics' off because of '" + arg + "'");
+        elif arg.startswith(STAGING_DIR):
+            stagingDir = arg[len(STAGING_DIR):];
+            if DEBUGGING: print("    >> Parsed '" + stagingDir + "' from '" + STAGING_DIR + "'");
+        elif arg.startswith(BENCHMARK):
+            benchmarkRuns = int(arg[len(BENCHMARK):]);
+            if DEBUGGING: print("    >> Parsed '" + str(benchmarkRuns) + "' from '" + BENCHMARK + "'");
+        elif arg.startswith(BENCHMARK_THRESHOLD):
+            benchmarkThreshold = float(arg[len(BENCHMARK_THRESHOLD):]);
+            if DEBUGGING: print("    >> Parsed '" + str(benchmarkThreshold) + "' from '" + BENCHMARK_THRESHOLD + "'");
+        elif arg.startswith(BISECT):
+            bisectRange = arg[len(BISECT):];
+            if DEBUGGING: print("    >> Parsed '" + bisectRange + "' from '" + BISECT + "'");
+        elif arg.startswith(BISECT_PATH):
+            bisectPath = arg[len(BISECT_PATH):];
+            if DEBUGGING: print("    >> Parsed '" + bisectPath + "' from '" + BISECT_PATH + "'");
+        elif arg.startswith(INCLUDE):
+            includePatterns.append(arg[len(INCLUDE):]);
+            if DEBUGGING: print("    >> Parsed '" + includePatterns[-1] + "' from '" + INCLUDE + "'");
+        elif arg.startswith(EXCLUDE):
+            excludePatterns.append(arg[len(EXCLUDE):]);
+            if DEBUGGING: print("    >> Parsed '" + excludePatterns[-1] + "' from '" + EXCLUDE + "'");
+        elif arg.startswith(WATCH):
+            watchBranch = arg[len(WATCH):];
+            if DEBUGGING: print("    >> Parsed '" + watchBranch + "' from '" + WATCH + "'");
+        elif arg.startswith(POLL_INTERVAL):
+            pollInterval = int(arg[len(POLL_INTERVAL):]);
+            if DEBUGGING: print("    >> Parsed '" + str(pollInterval) + "' from '" + POLL_INTERVAL + "'");
+        elif arg.startswith(STORAGE):
+            storage = arg[len(STORAGE):];
+            if DEBUGGING: print("    >> Parsed '" + storage + "' from '" + STORAGE + "'");
+        elif arg.startswith(QUERY):
+            queryPath = arg[len(QUERY):];
+            if DEBUGGING: print("    >> Parsed '" + queryPath + "' from '" + QUERY + "'");
+        elif arg == YES:
+            assumeYes = True;
+            if DEBUGGING: print("    >> Turning 'assumeYes' on because of '" + arg + "'");
+        elif arg == DIFF_ONLY:
+            diffOnly = True;
+            if DEBUGGING: print("    >> Turning 'diffOnly' on because of '" + arg + "'");
+        elif arg == AGGRESSIVE_GC:
+            aggressiveGc = True;
+            if DEBUGGING: print("    >> Turning 'aggressiveGc' on because of '" + arg + "'");
+        elif arg == INCREMENTAL_BUILD:
+            incrementalBuild = True;
+            if DEBUGGING: print("    >> Turning 'incrementalBuild' on because of '" + arg + "'");
+        elif arg.startswith(COORDINATOR):
+            coordinatorQueueDir = os.path.abspath(arg[len(COORDINATOR):]);
+            if DEBUGGING: print("    >> Parsed '" + coordinatorQueueDir + "' from '" + COORDINATOR + "'");
+        elif arg.startswith(WORKER):
+            workerQueueDir = os.path.abspath(arg[len(WORKER):]);
+            if DEBUGGING: print("    >> Parsed '" + workerQueueDir + "' from '" + WORKER + "'");
+        elif arg == ANCESTRY_PATH:
+            ancestryPath = True;
+            if DEBUGGING: print("    >> Turning 'ancestryPath' on because of '" + arg + "'");
+        elif arg == RESUME:
+            resume = True;
+            if DEBUGGING: print("    >> Turning 'resume' on because of '" + arg + "'");
+        elif arg == REPORT:
+            reportDir = "";
+            if DEBUGGING: print("    >> Turning 'report' on because of '" + arg + "'");
+        elif arg.startswith(REPORT_DIR):
+            reportDir = os.path.abspath(arg[len(REPORT_DIR):]);
+            if DEBUGGING: print("    >> Parsed '" + reportDir + "' from '" + REPORT_DIR + "'");
+        elif arg.startswith(BUILD_CACHE_SIZE):
+            buildCacheSize = int(arg[len(BUILD_CACHE_SIZE):]);
+            if DEBUGGING: print("    >> Parsed '" + str(buildCacheSize) + "' from '" + BUILD_CACHE_SIZE + "'");
+        elif arg.startswith(SHORT_JOBS):
+            jobCount = int(arg[len(SHORT_JOBS):]);
+            runInParallel = True;
+            if DEBUGGING: print("    >> Parsed '" + str(jobCount) + "' from '" + SHORT_JOBS + "', turning 'runInParallel' on");
+        elif arg.startswith(LONG_JOBS):
+            jobCount = int(arg[len(LONG_JOBS):]);
+            runInParallel = True;
+            if DEBUGGING: print("    >> Parsed '" + str(jobCount) + "' from '" + LONG_JOBS + "', turning 'runInParallel' on");
+        elif arg.startswith(WORKTREES):
+            worktreeCount = int(arg[len(WORKTREES):]);
+            if DEBUGGING: print("    >> Parsed '" + str(worktreeCount) + "' from '" + WORKTREES + "'");
         elif arg == LONG_DEBUGGING:
             assert DEBUGGING == True;
             print("    >> 'DEBUGGING' was already turned on because of '" + arg + "'");
@@ -312,18 +1054,55 @@ if __name__ == "__main__":
         print("    >> projPath = '" + str(projPath) + "'");
         print("    >> compilersPath = '" + str(compilersPath) + "'");
         print("    >> runInParallel = '" + str(runInParallel) + "'");
+        print("    >> jobCount = '" + str(jobCount) + "'");
+        print("    >> worktreeCount = '" + str(worktreeCount) + "'");
+        print("    >> useBuildCache = '" + str(useBuildCache) + "'");
+        print("    >> skipUnchanged = '" + str(skipUnchanged) + "'");
+        print("    >> incremental = '" + str(incremental) + "'");
+        print("    >> batchCompile = '" + str(batchCompile) + "'");
+        print("    >> orderedDiagnostics = '" + str(orderedDiagnostics) + "'");
+        print("    >> stagingDir = '" + str(stagingDir) + "'");
+        print("    >> reportDir = '" + str(reportDir) + "'");
+        print("    >> benchmarkRuns = '" + str(benchmarkRuns) + "'");
+        print("    >> benchmarkThreshold = '" + str(benchmarkThreshold) + "'");
+        print("    >> resume = '" + str(resume) + "'");
+        print("    >> ancestryPath = '" + str(ancestryPath) + "'");
+        print("    >> bisectRange = '" + str(bisectRange) + "'");
+        print("    >> bisectPath = '" + str(bisectPath) + "'");
+        print("    >> incrementalBuild = '" + str(incrementalBuild) + "'");
+        print("    >> includePatterns = '" + str(includePatterns) + "'");
+        print("    >> excludePatterns = '" + str(excludePatterns) + "'");
+        print("    >> aggressiveGc = '" + str(aggressiveGc) + "'");
+        print("    >> diffOnly = '" + str(diffOnly) + "'");
+        print("    >> watchBranch = '" + str(watchBranch) + "'");
+        print("    >> pollInterval = '" + str(pollInterval) + "'");
+        print("    >> assumeYes = '" + str(assumeYes) + "'");
+        print("    >> storage = '" + str(storage) + "'");
+        print("    >> queryPath = '" + str(queryPath) + "'");
+        print("    >> coordinatorQueueDir = '" + str(coordinatorQueueDir) + "'");
+        print("    >> workerQueueDir = '" + str(workerQueueDir) + "'");
+        print("    >> buildCacheSize = '" + str(buildCacheSize) + "'");
         print();
 
 
 
 
+    # Querying only reads from the archives we've already stored, so we don't need to touch the repository at all.
+    if queryPath != None:
+        if len(branches) > 2:
+            print("ERROR: you can only specify up to two branches when querying the archives");
+            exit(39);
+        repoRoot = runCommand(["git", "rev-parse", "--show-toplevel"], None, checked=True, capture=True);
+        exit(0 if queryArchive(os.path.join(repoRoot, "_slice_archive_"), queryPath, branches) else 40);
+
     # Before we do anything else, make sure the user is VERY AWARE that this will clean and reset their repo...
     print();
     print("!!! ------------------------------------------------- !!!");
     print("!!! BE WARNED THIS SCRIPT WILL CLEAN THE CURRENT REPO !!!");
     print("!!! DO NOT RUN THIS IF YOU HAVE ANY UNSAVED WORK LEFT !!!");
     print("!!! ------------------------------------------------- !!!");
-    input("Press Enter to continue...");
+    if not assumeYes:
+        input("Press Enter to continue...");
     print();
 
 
@@ -344,19 +1123,54 @@ if __name__ == "__main__":
     # We don't create it yet, just compute what the path is and store it.
     compareDir = os.path.join(REPO_ROOT, "_slice_compare_");
 
-    # If we're going to be running the Slice compiler in parallel, we allocate a process pool to use for that.
+    # When `--storage=archive` is enabled, this is where we store the generated code instead. It's never removed by `git_clean`.
+    archiveDir = os.path.join(REPO_ROOT, "_slice_archive_");
+
+    # This is where we store the generated code and the report when `--diff-only` is enabled. It's never removed by `git_clean`.
+    diffDir = os.path.join(REPO_ROOT, "_slice_diff_");
+
+    # This is where we cache built compilers when `--build-cache` is enabled. It's never removed by `git_clean`.
+    buildCacheDir = os.path.join(REPO_ROOT, "_slice_cache_", "compilers");
+
+    # When `--incremental` is enabled, this is where we store the information about the last branch we generated code for,
+    # and the cache of which files each Slice file includes (keyed by the git blob hash of each Slice file).
+    incrementalStatePath = os.path.join(REPO_ROOT, "_slice_cache_", "incremental.json");
+    includeCachePath = os.path.join(REPO_ROOT, "_slice_cache_", "includes.json");
+
+    # This is where we remember how long each compiler took to compile each Slice file, so we can start the slowest jobs first.
+    compileStatsPath = os.path.join(REPO_ROOT, "_slice_cache_", "compile-stats.json");
+    COMPILE_STATS = loadJson(compileStatsPath, {});
+
+    # If a report was requested without specifying where to store it, we store it in the repository (`git_clean` ignores this folder).
+    if reportDir == "":
+        reportDir = os.path.join(REPO_ROOT, "_slice_report_");
+        if DEBUGGING: print("    >> No report directory was specified. Setting to '" + reportDir + "'");
+
+    # If a staging directory was specified, that's where we generate code into, instead of the repository's working tree.
+    # 'ram' is a shortcut for a RAM-backed filesystem ('/dev/shm'), falling back to the system's temporary directory if there isn't one.
+    if stagingDir == "ram":
+        stagingDir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir();
+        if DEBUGGING: print("    >> Using '" + stagingDir + "' as the staging directory");
+    if (stagingDir != None) and not os.path.isdir(stagingDir):
+        print("ERROR: the staging directory '" + stagingDir + "' does not exist!");
+        exit(19);
+
+    if (benchmarkRuns != None) and (benchmarkRuns < 1):
+        print("ERROR: the number of benchmark runs must be at least 1");
+        exit(20);
+    if (benchmarkThreshold != None) and (benchmarkRuns == None):
+        print("ERROR: you cannot specify a benchmark threshold without enabling benchmarking");
+        exit(21);
+
+    # If we're going to be running the Slice compiler in parallel, we allocate a thread pool to use for that.
+    # Each job spends its whole life waiting on a compiler process, so there's no benefit to using a process pool here.
     if runInParallel:
-        EXECUTOR = concurrent.futures.ProcessPoolExecutor();
-        if DEBUGGING: print("    >> Allocated a parallel executor with " + str(EXECUTOR._max_workers) + "processes");
+        EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=(jobCount if jobCount != None else os.cpu_count()));
+        if DEBUGGING: print("    >> Allocated a parallel executor with " + str(EXECUTOR._max_workers) + " threads");
 
     # Store which branch the repository is currently on, so we can switch back to it when we're done running.
     ORIGINAL_BRANCH = runCommand(["git", "rev-parse", "--abbrev-ref", "HEAD"], None, checked=True, capture=True);
 
-    # If no compilers were specified, we want to run _all_ the compilers.
-    if len(compilers) == 0:
-        compilers = ["ice2slice", "slice2cpp", "slice2cs", "slice2java", "slice2js", "slice2matlab", "slice2php", "slice2py", "slice2rb", "slice2swift"];
-        if DEBUGGING: print("    >> No compilers were specified. Setting to '" + str(compilers) + "'");
-
     # Only one of these 'modes' can be used at a time: "specific branches", "back-tracking", and 'catch-up".
     # If any pair of these have been enabled by command-line input, we exit with an error.
     if (len(branches) != 0) and (backTrack != None):
@@ -369,39 +1183,164 @@ if __name__ == "__main__":
         print("ERROR: you cannot specify a back-track count and enable catch-up mode at the same time");
         exit(14);
 
-    # If no branches were specified, and we aren't back-tracking or catching-up, we default to using the current branch.
-    if len(branches) == 0 and backTrack == None and catchup == False:
+    if (jobCount != None) and (jobCount < 1):
+        print("ERROR: the number of jobs must be at least 1");
+        exit(18);
+    if (worktreeCount != None) and (worktreeCount < 1):
+        print("ERROR: the number of worktrees must be at least 1");
+        exit(15);
+    # Incremental generation re-uses the results of the previous branch, so it's impossible to build branches out of order.
+    if incremental and (worktreeCount != None):
+        print("ERROR: you cannot use incremental generation and worktrees at the same time");
+        exit(17);
+
+    if ancestryPath and (catchup == False) and (watchBranch == None):
+        print("ERROR: you can only use '--ancestry-path' in catch-up or watch mode");
+        exit(26);
+    # Bisecting searches through its own range of commits (one at a time), and doesn't store anything in '_slice_compare_'.
+    if (bisectRange != None) and ((len(branches) != 0) or (backTrack != None) or catchup or resume or incremental or (worktreeCount != None)):
+        print("ERROR: you cannot use '--bisect' with '--branch', '--back-track', '--catchup', '--resume', '--incremental', or '--worktrees'");
+        exit(27);
+    # Workers build whatever commits the coordinator tells them to, and the coordinator doesn't build anything itself.
+    if (coordinatorQueueDir != None) and (incremental or (worktreeCount != None) or (bisectRange != None)):
+        print("ERROR: you cannot use '--coordinator' with '--incremental', '--worktrees', or '--bisect'");
+        exit(29);
+    if (workerQueueDir != None) and ((len(branches) != 0) or (backTrack != None) or catchup or resume or incremental or (worktreeCount != None) or (bisectRange != None) or (coordinatorQueueDir != None)):
+        print("ERROR: you cannot use '--worker' with any option that chooses which branches to compare, '--incremental', or '--worktrees'");
+        exit(30);
+    # Diffing only compares two branches directly against each other, and doesn't store anything in '_slice_compare_' either.
+    if diffOnly and (len(branches) != 2):
+        print("ERROR: '--diff-only' needs exactly two branches to compare (specified with '--branch')");
+        exit(31);
+    if diffOnly and (resume or incremental or (worktreeCount != None) or (bisectRange != None) or (coordinatorQueueDir != None) or (workerQueueDir != None)):
+        print("ERROR: you cannot use '--diff-only' with '--resume', '--incremental', '--worktrees', '--bisect', '--coordinator', or '--worker'");
+        exit(32);
+    # Watching picks which commits to compare by itself (like catching-up does), as they show up on the watched branch.
+    if (watchBranch != None) and ((len(branches) != 0) or (backTrack != None) or catchup or resume or (bisectRange != None) or diffOnly or (workerQueueDir != None)):
+        print("ERROR: you cannot use '--watch' with any other option that chooses which branches to compare, '--diff-only', or '--worker'");
+        exit(34);
+    if (pollInterval != None) and (watchBranch == None):
+        print("ERROR: you cannot specify a poll interval without enabling watch mode");
+        exit(35);
+    if (pollInterval != None) and (pollInterval < 1):
+        print("ERROR: the poll interval must be at least 1 second");
+        exit(36);
+    # Archives can't be resumed or caught-up like '_slice_compare_' can, and they're only for storing results (which some modes don't do).
+    if storage not in ["git", "archive"]:
+        print("ERROR: unknown storage backend '" + storage + "', it must be either 'git' or 'archive'");
+        exit(37);
+    if (storage == "archive") and (resume or catchup or (watchBranch != None) or incremental or diffOnly or (bisectRange != None) or (workerQueueDir != None)):
+        print("ERROR: you cannot use '--storage=archive' with '--resume', '--catchup', '--watch', '--incremental', '--diff-only', '--bisect', or '--worker'");
+        exit(38);
+    if (bisectRange != None) and (".." not in bisectRange):
+        print("ERROR: the range to bisect must be of the form '<good>..<bad>'");
+        exit(28);
+
+    # When skipping unchanged branches, this is the branch we compare the first one against. When we're catching-up or resuming,
+    # that's the last commit we compared on a previous run, otherwise it's `None`, since we haven't compared anything yet.
+    previousComparedBranch = None;
+
+    # We keep a journal of the current run inside our scratch repository's '.git' folder (so it's never committed or cleaned).
+    # It holds the list of branches we planned to compare, and how many of them have been stored so far.
+    JOURNAL_PATH = os.path.join(compareDir, ".git", "compiler-comparer-journal.json");
+    journal = None;
+
+    # If we're resuming, we pick up the plan of the run that was stopped from its journal, skipping any branches it already finished.
+    if resume:
+        if (len(branches) != 0) or (backTrack != None) or (catchup != False):
+            print("ERROR: you cannot specify branches, a back-track count, or enable catch-up mode when resuming a run");
+            exit(23);
+        journal = loadJson(JOURNAL_PATH, None);
+        if journal == None:
+            print("ERROR: there is no run to resume, '" + JOURNAL_PATH + "' does not exist");
+            exit(24);
+
+        # The journal is only updated after a branch has been stored, so if the run was stopped in between these,
+        # the branch's commit will already be in our scratch repository, right on top of the commit the journal knows about.
+        compareHead = runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD"], "git -C ... rev-parse HEAD", checked=False, capture=True);
+        if compareHead != journal["compareHead"]:
+            compareParent = runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD^"], "git -C ... rev-parse HEAD^", checked=False, capture=True);
+            if compareParent != journal["compareHead"]:
+                print("ERROR: cannot resume, '_slice_compare_' has been modified since the run was stopped");
+                exit(25);
+            journal["completed"] += 1;
+            journal["compareHead"] = compareHead;
+
+        # Unless they were specified again, we use the same compilers and Slice files as the run we're resuming.
+        # These are stored as bare compiler names, and Slice file paths relative to the repository, in case it's been moved since.
+        if len(compilers) == 0:
+            compilers = journal["compilers"];
+        if len(sliceFiles) == 0:
+            sliceFiles = [os.path.join(REPO_ROOT, f) for f in journal["sliceFiles"]];
+        branches = journal["branches"][journal["completed"]:];
+        backTrack = (len(branches) - 1) if journal["backTrack"] else None;
+        if journal["completed"] != 0:
+            previousComparedBranch = journal["branches"][journal["completed"] - 1];
+
+        # Any compilers that were built before the run was stopped are still in the build cache, so make sure we use it.
+        useBuildCache = True;
+        print("Resuming the previous run: " + str(journal["completed"]) + " of " + str(len(journal["branches"])) + " branches were already finished.");
+        if DEBUGGING: print("    >> Resuming with branches = '" + str(branches) + "'");
+
+    # If no compilers were specified, we want to run _all_ the compilers.
+    if len(compilers) == 0:
+        compilers = ["ice2slice", "slice2cpp", "slice2cs", "slice2java", "slice2js", "slice2matlab", "slice2php", "slice2py", "slice2rb", "slice2swift"];
+        if DEBUGGING: print("    >> No compilers were specified. Setting to '" + str(compilers) + "'");
+
+    # If no branches were specified, and we aren't back-tracking, catching-up, or watching, we default to using the current branch.
+    if len(branches) == 0 and backTrack == None and catchup == False and resume == False and watchBranch == None:
         branches = [ORIGINAL_BRANCH];
         if DEBUGGING: print("    >> No branches were specified. Setting to current branch '" + str(branches[0]) + "'");
 
-    # If we're 'catching-up', we re-use back-tracking by determining how many commits '_slice_compare_' is behind 'HEAD'.
+    # When watching, we keep every compiler we build in the build cache, so only the compilers whose sources changed get rebuilt.
+    if watchBranch != None:
+        useBuildCache = True;
+        if pollInterval == None:
+            pollInterval = WATCH_POLL_INTERVAL_DEFAULT;
+            if DEBUGGING: print("    >> No poll interval was specified. Setting to '" + str(pollInterval) + "'");
+
+    # Returns the ID of the last commit that was compared with this script (from the commit message in our scratch repository),
+    # or `None` if there's no scratch repository, or nothing has been compared in it yet.
+    def getLastComparedCommit():
+        if not os.path.isdir(os.path.join(compareDir, ".git")):
+            return None;
+        lastComparedCommitMessage = runCommand(["git", "-C", compareDir, "log", "--format=%B", "-n", "1"], None, checked=False, capture=True);
+        if "zeroc-ice/ice@" not in lastComparedCommitMessage:
+            return None;
+        idStart = lastComparedCommitMessage.index("zeroc-ice/ice@") + len("zeroc-ice/ice@");
+        idEnd = lastComparedCommitMessage.index(')', idStart);
+        return lastComparedCommitMessage[idStart : idEnd];
+
+    # Returns every commit that comes after 'lastComparedCommit' up to 'tip', oldest first. By default we only follow the first parent
+    # of merge commits (the same commits that back-tracking would visit). With `--ancestry-path`, we instead get every commit that
+    # descends from the last compared commit, including the ones that were merged in from other branches.
+    def getCommitsSince(lastComparedCommit, tip):
+        if ancestryPath:
+            args = ["git", "rev-list", "--ancestry-path", "--topo-order", "--reverse", lastComparedCommit + ".." + tip];
+        else:
+            args = ["git", "rev-list", "--first-parent", "--reverse", lastComparedCommit + ".." + tip];
+        return runCommand(args, "git rev-list ... <last>..<tip>", checked=True, capture=True).split();
+
+    # If we're 'catching-up', we fill the 'branches' field with every commit that '_slice_compare_' is behind 'HEAD'.
     if catchup:
-        if DEBUGGING: print("    > Catchup mode has been enabled. Determining how many commits to backtrack...");
-        if not os.path.isdir(compareDir):
+        if DEBUGGING: print("    > Catchup mode has been enabled. Determining which commits to compare...");
+        previousComparedBranch = getLastComparedCommit();
+        if previousComparedBranch == None:
             print("Catchup mode was specified, but there was no pre-existing '_slice_compare_' repo to catch up!");
             exit(16);
+        branches = getCommitsSince(previousComparedBranch, "HEAD");
 
-        # Get the commit ID of the last commit that was compared with this script from the commit message.
-        lastComparedCommitMessage = runCommand(["git", "-C", compareDir, "log", "--format=%B", "-n", "1"], None, checked=True, capture=True);
-        idStart = lastComparedCommitMessage.index("zeroc-ice/ice@") + len("zeroc-ice/ice@");
-        idEnd = lastComparedCommitMessage.index(')', idStart);
-        lastComparedCommitId = lastComparedCommitMessage[idStart : idEnd];
-
-        # Determine how many commits behind this is from the current repository's 'HEAD'.
-        # Then we subtract '1', because backTrack always adds '1' because it wants to build the last commit.
-        # But here, we've already done the 'last commit' we only want to do the commits that come after it.
-        commitsBehind = runCommand(["git", "rev-list", "--count", lastComparedCommitId + ".."], None, checked=True, capture=True);
-        backTrack = int(commitsBehind) - 1;
-        if DEBUGGING: print("    > To catchup, we need to backtrack by '" + commitsBehind + "' commits");
+        # We still count down the remaining commits like back-tracking does, to report our progress.
+        backTrack = len(branches) - 1;
+        if DEBUGGING: print("    > To catchup, we need to compare '" + str(len(branches)) + "' commits");
 
-    # If we're 'back-tracking', we re-use the 'branches' field by filling it with the last N commits.
-    if backTrack != None:
+    # If we're 'back-tracking', we re-use the 'branches' field by filling it with the last N commits (following first parents).
+    # When resuming or catching-up, 'branches' already holds the commits that we need to compare, so there's nothing to do.
+    elif backTrack != None and resume == False:
         if DEBUGGING: print("    >> branches has been set to backtrack " + str(backTrack) + " times");
-        backCommits = [("HEAD~" + str(i)) for i in range(backTrack + 1)];
-        backCommits.reverse();
-        for commit in backCommits:
-            commitID = runCommand(["git", "rev-parse", commit], "git rev-parse <commit>", checked=True, capture=True);
-            branches.append(commitID);
+        args = ["git", "rev-list", "--first-parent", "--reverse", "--max-count=" + str(backTrack + 1), "HEAD"];
+        branches = runCommand(args, "git rev-list ... HEAD", checked=True, capture=True).split();
+
 
     # If no slice files were provided, we want to recursively get ALL the slice files in the current directory.
     if len(sliceFiles) == 0:
@@ -439,50 +1378,1126 @@ if __name__ == "__main__":
         compilers = [c + ".exe" for c in compilers];
     if DEBUGGING: print("    >> (sanitized) compilers = '" + str(compilers) + "'");
 
-    def resolveSliceFiles(sliceFiles):
-        # Check for any directories that were passed in as Slice files.
-        # We recursively check each of these directories for Slice files and use those instead.
+    # Holds the paths of every Slice file that git is tracking, keyed by the hash of the tree they were listed from.
+    # Commits which didn't change any files share the same tree, so we only need to list their files once.
+    TRACKED_SLICE_FILES = {};
+
+    # Returns the paths (relative to 'rootDir') of all the Slice files that git is tracking in the commit checked out in 'rootDir'.
+    def getTrackedSliceFiles(rootDir):
+        treeHash = runCommand(["git", "-C", rootDir, "rev-parse", "HEAD^{tree}"], "git -C ... rev-parse HEAD^{tree}", checked=True, capture=True);
+        if treeHash not in TRACKED_SLICE_FILES:
+            trackedFiles = runCommand(["git", "-C", rootDir, "ls-tree", "-r", "-z", "--name-only", "HEAD"], "git -C ... ls-tree -r HEAD", checked=True, capture=True);
+            TRACKED_SLICE_FILES[treeHash] = [f for f in trackedFiles.split("\0") if f.endswith(".ice")];
+        elif DEBUGGING: print("    >> Re-using the Slice files of tree '" + treeHash + "'");
+        return TRACKED_SLICE_FILES[treeHash];
+
+    def resolveSliceFiles(sliceFiles, rootDir):
+        # If we're resolving the Slice files inside of a worktree, re-root all the paths onto it first.
+        sliceFiles = [rebasePath(f, rootDir, REPO_ROOT) for f in sliceFiles];
+
+        # We want forward slashes only, and to make sure that all the paths live in the repository.
+        sanitizedRepoRoot = rootDir.replace('\\', '/') + '/';
+        if DEBUGGING: print("    >> 'sanitizedRepoRoot' = '" + str(sanitizedRepoRoot) + "'");
+
+        # Check for any directories that were passed in as Slice files, and use all the Slice files that live in them instead.
+        # Rather than walking these directories (which can be full of build outputs), we ask git which Slice files it's tracking.
         resolvedSliceFiles = [];
         for file in sliceFiles:
-            if os.path.isdir(file):
-                globPattern = os.path.join(file, "**/*.ice");
-                if DEBUGGING: print("    >> Encountered Slice directory of '" + file + "', globbing for '" + str(globPattern) + "'");
-                resolvedSliceFiles.extend(glob.iglob(globPattern, recursive=True));
+            sanitizedFile = os.path.abspath(file).replace('\\', '/');
+            if not (sanitizedFile + '/').startswith(sanitizedRepoRoot):
+                print("ERROR: This script cannot be run on '" + sanitizedFile + "' since it lives outside of the repository.");
+            elif os.path.isdir(file):
+                directoryPrefix = (sanitizedFile + '/')[len(sanitizedRepoRoot):];
+                if DEBUGGING: print("    >> Encountered Slice directory of '" + file + "', using the Slice files under '" + directoryPrefix + "'");
+                resolvedSliceFiles.extend(f for f in getTrackedSliceFiles(rootDir) if f.startswith(directoryPrefix));
+            elif not os.path.isfile(file):
+                print("ERROR: The Slice file '" + sanitizedFile + "' does not exist on the current branch.");
             else:
-                resolvedSliceFiles.append(file);
+                resolvedSliceFiles.append(sanitizedFile[len(sanitizedRepoRoot):]);
 
-        # After we know that we only have files left, we need to sanitize the Slice file paths.
-        # We want forward slashes only, and to make sure that all the paths live in the repository.
-        resolvedSliceFiles = [os.path.abspath(f).replace('\\', '/') for f in resolvedSliceFiles];
-        sanitizedRepoRoot = REPO_ROOT.replace('\\', '/') + '/';
-        if DEBUGGING: print("    >> 'sanitizedRepoRoot' = '" + str(sanitizedRepoRoot) + "'");
-        for f in resolvedSliceFiles:
-            if not f.startswith(sanitizedRepoRoot):
-                print("ERROR: This script cannot be run on '" + f + "' since it lives outside of the repository.");
-            if not os.path.exists(f):
-                print("ERROR: The Slice file '" + f + "' does not exist on the current branch.");
-
-        # Remove the REPO_ROOT from the slice Files, and filter out any files which live outside of the repository.
-        resolvedSliceFiles = [f[len(sanitizedRepoRoot):] for f in resolvedSliceFiles if (f.startswith(sanitizedRepoRoot) and os.path.isfile(f))];
+        # Filter out any files that weren't included by `--include`, or that were excluded by `--exclude`.
+        # Files that are excluded by default are only kept if they were specifically included.
+        def isIncluded(file):
+            isSpecificallyIncluded = any(fnmatch.fnmatchcase(file, pattern) for pattern in includePatterns);
+            if (len(includePatterns) != 0) and not isSpecificallyIncluded:
+                return False;
+            if any(fnmatch.fnmatchcase(file, pattern) for pattern in excludePatterns):
+                return False;
+            return isSpecificallyIncluded or not any(fnmatch.fnmatchcase(file, pattern) for pattern in DEFAULT_SLICE_EXCLUDES);
+
+        resolvedSliceFiles = list(filter(isIncluded, resolvedSliceFiles));
         if DEBUGGING:
             print();
             print("    >> resolvedSliceFiles = '" + str(resolvedSliceFiles) + "'");
             print();
 
-        # TODO: delete this and add negative file searching or something!
-        def removeStuff(file):
-            if file.startswith("cpp/test/Slice"):
-                return False;
-            if file.startswith("java/test/Ice") or file.startswith("java-compat/test/Ice"):
-                return False;
-            return True;
-        resolvedSliceFiles = list(filter(removeStuff, resolvedSliceFiles));
-
         print("    A total of " + str(len(resolvedSliceFiles)) + " Slice files will be compiled.");
         return resolvedSliceFiles;
 
+    # Returns the name of the branch that 'branch' refers to, or 'HEAD' if it isn't a local branch (ie. it's a commit ID).
+    def getBranchName(branch):
+        fullName = runCommand(["git", "rev-parse", "--symbolic-full-name", branch], "git rev-parse --symbolic-full-name <branch>", checked=True, capture=True);
+        return fullName[len("refs/heads/"):] if fullName.startswith("refs/heads/") else "HEAD";
+
+    # Creates the report for a single branch. Its lists of commands are `None` unless `--report` is enabled, so nothing is recorded.
+    def newBranchReport(branchName, branchID):
+        return {"branch": branchName, "commit": branchID, "phases": {}, "commands": ([] if reportDir != None else None), "compiles": []};
+
+    # Makes 'runCommand' record the commands this thread runs into 'commands', and returns whichever list it was using before.
+    def setReportContext(commands):
+        previousCommands = getattr(REPORT_CONTEXT, "commands", None);
+        REPORT_CONTEXT.commands = commands;
+        return previousCommands;
+
+    # Runs 'function', and records how long it took as 'phase' in 'branchReport' (along with all the commands it ran).
+    def timePhase(branchReport, phase, function, *args):
+        previousCommands = setReportContext(branchReport["commands"]);
+        startTime = time.perf_counter();
+        try:
+            return function(*args);
+        finally:
+            branchReport["phases"][phase] = branchReport["phases"].get(phase, 0) + (time.perf_counter() - startTime);
+            setReportContext(previousCommands);
+
+    # Runs 'sliceCompileBatch', and records how long the compiler took, how much CPU time it used, and its peak memory usage.
+    # We always remember how long it took in `COMPILE_STATS` (split evenly between the files in the batch), and return it alongside the results.
+    def compileJob(branchReport, compiler, batch, jobOutputDir, workDir):
+        commands = [] if reportDir != None else None;
+        previousCommands = setReportContext(commands);
+        startTime = time.perf_counter();
+        try:
+            results = sliceCompileBatch(compiler, batch, jobOutputDir, workDir);
+        finally:
+            setReportContext(previousCommands);
+            wallTime = time.perf_counter() - startTime;
+            if commands != None:
+                cpuTimes = [c["cpu"] for c in commands];
+                maxRsses = [c["maxRss"] for c in commands];
+                branchReport["compiles"].append({
+                    "compiler": Path(compiler).stem, "files": batch, "wall": wallTime,
+                    "cpu": (None if None in cpuTimes else sum(cpuTimes)), "maxRss": (None if None in maxRsses else max(maxRsses)),
+                });
+        with COMPILE_STATS_LOCK:
+            compilerStats = COMPILE_STATS.setdefault(Path(compiler).stem, {});
+            for file in batch:
+                duration = wallTime / len(batch);
+                compilerStats[file] = duration if file not in compilerStats else (COMPILE_STATS_WEIGHT * duration) + ((1 - COMPILE_STATS_WEIGHT) * compilerStats[file]);
+        return (results, wallTime);
+
+    # Runs each compiler over all of 'sliceFiles' 'benchmarkRuns' times, and returns the fastest and median wall time of these runs,
+    # and the peak memory usage of any compiler process. The compilers are run one at a time (even when running in parallel),
+    # so they don't compete with each other, and each run writes into an empty directory, so they all do the same amount of work.
+    def benchmarkCompilers(workCompilers, sliceFiles, benchmarkDir, workDir):
+        results = {};
+        for compiler in workCompilers:
+            compilerName = Path(compiler).stem;
+            print("    Benchmarking " + compilerName + "...");
+            batches = getSliceFileBatches(sliceFiles) if batchCompile else [[file] for file in sliceFiles];
+            (wallTimes, cpuTimes, maxRsses) = ([], [], []);
+            for _ in range(benchmarkRuns):
+                shutil.rmtree(benchmarkDir, ignore_errors=True);
+                commands = [];
+                previousCommands = setReportContext(commands);
+                startTime = time.perf_counter();
+                try:
+                    for batch in batches:
+                        sliceCompileBatch(compiler, batch, os.path.join(benchmarkDir, os.path.dirname(batch[0])), workDir);
+                finally:
+                    setReportContext(previousCommands);
+                wallTimes.append(time.perf_counter() - startTime);
+                cpuTimes.append(sum(c["cpu"] for c in commands) if all(c["cpu"] != None for c in commands) else None);
+                maxRsses.extend(c["maxRss"] for c in commands);
+            shutil.rmtree(benchmarkDir, ignore_errors=True);
+
+            results[compilerName] = {
+                "runs": benchmarkRuns,
+                "files": len(sliceFiles),
+                "minWall": round(min(wallTimes), 3),
+                "medianWall": round(statistics.median(wallTimes), 3),
+                "medianCpu": (None if None in cpuTimes else round(statistics.median(cpuTimes), 3)),
+                "maxRss": (None if None in maxRsses else max(maxRsses, default=0)),
+            };
+        return results;
+
+    # Compares the benchmark results of the branch we just stored against the previous branch's results, and remembers any compilers
+    # whose median wall time or peak memory usage grew by more than `--benchmark-threshold` percent, so we can fail the run at the end.
+    def checkBenchmarkRegressions(branchReport):
+        global previousBenchmark;
+        benchmark = branchReport.get("benchmark");
+        if benchmark == None:
+            return;
+        if (benchmarkThreshold != None) and (previousBenchmark != None):
+            for (compilerName, results) in benchmark.items():
+                previousResults = previousBenchmark.get(compilerName);
+                if previousResults == None:
+                    continue;
+                for metric in ["medianWall", "maxRss"]:
+                    (before, after) = (previousResults.get(metric), results[metric]);
+                    if (before == None) or (after == None) or (before == 0):
+                        continue;
+                    change = (after - before) * 100 / before;
+                    if change > benchmarkThreshold:
+                        regression = compilerName + " '" + metric + "' regressed by " + format(change, ".1f") + "% (" + str(before) + " -> " + str(after) + ") at '" + branchReport["branch"] + " @ " + branchReport["commit"] + "'";
+                        print("    !!!! " + regression);
+                        BENCHMARK_REGRESSIONS.append(regression);
+        previousBenchmark = benchmark;
+
+    # Checks out 'branch' inside of 'workDir', builds the Slice compilers there, and then runs them to generate code.
+    # 'workDir' is either the repository itself, or one of the worktrees we create when running with '--worktrees'.
+    # Returns the branch's name, the ID of the commit that was built, the directory the generated code was stored in,
+    # and the branch's report, which holds how long each phase took (and when `--report` is enabled, the commands it ran).
+    def buildAndGenerate(branch, workDir):
+        # Everything this thread runs from now on is part of this branch, so we record it into this branch's report.
+        branchReport = newBranchReport(None, None);
+        setReportContext(branchReport["commands"]);
+
+        # Checkout the branch, and perform a clean build.
+        timePhase(branchReport, "checkout", git_checkout, branch, "." if workDir == REPO_ROOT else workDir);
+        timePhase(branchReport, "clean", git_clean, False, workDir, incrementalBuild);
+        if incrementalBuild:
+            # The generated code from previous branches might be ignored by git, so we make sure to delete it ourselves.
+            for generatedDir in glob.glob(os.path.join(workDir, "_slice_gen_*")):
+                shutil.rmtree(generatedDir, ignore_errors=True);
+
+        # Get the branch's name and the ID of the commit it's pointing at.
+        branchName = getBranchName(branch);
+        branchID = runCommand(["git", "-C", workDir, "rev-parse", "--short", "HEAD"], "git -C ... rev-parse --short HEAD", checked=True, capture=True);
+        (branchReport["branch"], branchReport["commit"]) = (branchName, branchID);
+
+        # Create a directory to store the generated code in after we finish building the compilers in the next step.
+        # When using a staging directory, we mirror the layout of the repository inside of it, so worktrees don't collide.
+        outputDirBase = os.path.join(workDir, "_slice_gen_" + branchName + "_" + branchID);
+        repoOutputDirBase = outputDirBase;
+        if STAGING_ROOT != None:
+            outputDirBase = os.path.join(STAGING_ROOT, os.path.relpath(outputDirBase, REPO_ROOT));
+        Path(outputDirBase).mkdir(parents=True);
+
+        # And also go ahead and resolve which Slice files we should compile from this branch.
+        resolvedSliceFiles = resolveSliceFiles(sliceFiles, workDir);
+
+        # The compilers and project file need to be the ones inside of 'workDir', not the repository's.
+        workCompilers = [rebasePath(c, workDir, REPO_ROOT) for c in compilers];
+        workProjPath = rebasePath(projPath, workDir, REPO_ROOT);
+
+        # Compilers that can't safely share an output directory write into their own scratch directories under here instead.
+        scratchDirBase = outputDirBase + "_scratch";
+
+        # Diagnostics are streamed into the "DIAGNOSTICS" file as soon as they're produced, instead of being collected in memory.
+        with open(os.path.join(outputDirBase, "DIAGNOSTICS"), "w") as diagnosticsFile:
+            def writeDiagnostics(text):
+                # Worktrees live inside of the repository, so we have to strip their paths before the repository's.
+                # Paths into the staging directory are written as if the code had been generated inside the repository.
+                if STAGING_ROOT != None:
+                    text = text.replace(outputDirBase, repoOutputDirBase);
+                diagnosticsFile.write(text.replace(workDir, "REPO_ROOT").replace(REPO_ROOT, "REPO_ROOT"));
 
+            # Build the compilers so we can run them.
+            phaseStart = time.perf_counter();
+            try:
+                # If we're using the build cache, we only need to build the compilers that weren't already in it.
+                compilersToBuild = workCompilers;
+                if useBuildCache:
+                    cacheKeys = {c: getCompilerCacheKey(c, workDir) for c in workCompilers};
+                    compilersToBuild = [c for c in workCompilers if not restoreCachedCompiler(c, cacheKeys[c], buildCacheDir)];
+                    for c in workCompilers:
+                        if c not in compilersToBuild:
+                            print("    Using cached " + Path(c).stem + " (" + cacheKeys[c][:12] + ")");
+
+                if len(compilersToBuild) != 0:
+                    print("Building '" + branchName + " @ " + branchID + "'...");
+                    if DEBUGGING: print("--------------------------------------------------------------------------------");
+                    build(compilersToBuild, workProjPath);
+                    if DEBUGGING: print("--------------------------------------------------------------------------------");
+                    print("Build complete!");
+
+                    if useBuildCache:
+                        for c in compilersToBuild:
+                            storeCachedCompiler(c, cacheKeys[c], buildCacheDir, buildCacheSize * 1024 * 1024);
+                branchReport["phases"]["build"] = time.perf_counter() - phaseStart;
+                phaseStart = time.perf_counter();
+
+                # Figure out which Slice files each compiler needs to compile. Normally that's all of them, but when running incrementally,
+                # we can re-use the code generated for the previous branch for any Slice files which haven't changed.
+                if incremental:
+                    (filesToCompile, diagnostics) = planIncrementalGeneration(workDir, resolvedSliceFiles, workCompilers, outputDirBase);
+                else:
+                    (filesToCompile, diagnostics) = ({Path(c).stem: resolvedSliceFiles for c in workCompilers}, {});
+
+                # Split the files up into the jobs we're going to run. Without batching, each job only compiles a single file.
+                jobs = [];
+                for compiler in workCompilers:
+                    compilerName = Path(compiler).stem;
+                    compilerOutputDir = os.path.join(outputDirBase, compilerName);
+                    if batchCompile:
+                        batches = getSliceFileBatches(filesToCompile[compilerName]);
+                    else:
+                        batches = [[file] for file in filesToCompile[compilerName]];
+
+                    # Some compilers share generated files and directories between Slice files (like 'slice2py's "__init__.py" files),
+                    # and race against each other when run in parallel. So each of their jobs writes into its own scratch directory,
+                    # and afterwards we merge these back together, in the same order they would've been generated in serially.
+                    usesScratchDirs = runInParallel and compilerName in SHARED_OUTPUT_COMPILERS;
+                    for (index, batch) in enumerate(batches):
+                        outputDir = os.path.join(compilerOutputDir, os.path.dirname(batch[0]));
+                        jobOutputDir = os.path.join(scratchDirBase, compilerName, str(index)) if usesScratchDirs else outputDir;
+                        jobs.append((compiler, batch, outputDir, jobOutputDir));
+
+                # Unless `--unordered-diagnostics` was specified, we write diagnostics in the order the files would've been compiled in
+                # serially, so that the "DIAGNOSTICS" file doesn't change between branches just because the compilers finished in a
+                # different order. Diagnostics that arrive early are held onto until everything before them has been written.
+                compiledFiles = {name: set(files) for (name, files) in filesToCompile.items()};
+                diagnosticsOrder = [
+                    (Path(c).stem, f) for c in workCompilers for f in resolvedSliceFiles if (f in compiledFiles[Path(c).stem]) or (f in diagnostics.get(Path(c).stem, {}))
+                ];
+                pendingDiagnostics = {};
+                nextDiagnostic = 0;
+                def recordDiagnostics(compilerName, file, result):
+                    nonlocal nextDiagnostic;
+                    if incremental:
+                        diagnostics.setdefault(compilerName, {})[file] = result;
+                    if not orderedDiagnostics:
+                        writeDiagnostics(result);
+                        return;
+                    pendingDiagnostics[(compilerName, file)] = result;
+                    while (nextDiagnostic < len(diagnosticsOrder)) and (diagnosticsOrder[nextDiagnostic] in pendingDiagnostics):
+                        writeDiagnostics(pendingDiagnostics.pop(diagnosticsOrder[nextDiagnostic]));
+                        nextDiagnostic += 1;
+
+                # Any diagnostics we're re-using from the previous branch are already available.
+                for (compilerName, compilerDiagnostics) in list(diagnostics.items()):
+                    for file in resolvedSliceFiles:
+                        if (file in compilerDiagnostics) and (file not in compiledFiles[compilerName]):
+                            recordDiagnostics(compilerName, file, compilerDiagnostics[file]);
+
+                print("    Running " + ", ".join(Path(c).stem for c in workCompilers) + "...");
+                if runInParallel:
+                    # Submit every job (for every compiler) up front, so the pool never sits idle between compilers. We submit the most
+                    # expensive jobs first, so that we don't end up waiting on a single large file at the very end. We estimate how
+                    # expensive each job is from how long it took the last time we ran it. For any files we haven't compiled before,
+                    # we fall back to their size, converted into seconds using how fast the files that we have compiled before went.
+                    with COMPILE_STATS_LOCK:
+                        knownCosts = [(COMPILE_STATS[Path(c).stem][f], os.path.getsize(os.path.join(workDir, f))) for (c, batch, _, _) in jobs for f in batch if f in COMPILE_STATS.get(Path(c).stem, {})];
+                        secondsPerByte = (sum(c[0] for c in knownCosts) / max(sum(c[1] for c in knownCosts), 1)) if len(knownCosts) != 0 else 1.0;
+                        jobCosts = [];
+                        for (compiler, batch, _, _) in jobs:
+                            compilerStats = COMPILE_STATS.get(Path(compiler).stem, {});
+                            jobCosts.append(sum((compilerStats[f] if f in compilerStats else os.path.getsize(os.path.join(workDir, f)) * secondsPerByte) for f in batch));
+                    if DEBUGGING: print("    >> Estimated '" + str(len(knownCosts)) + "' job costs from previous runs, and '" + str(secondsPerByte) + "' seconds per byte for the rest");
+                    futures = {};
+                    for index in sorted(range(len(jobs)), key=lambda i: jobCosts[i], reverse=True):
+                        (compiler, batch, _, jobOutputDir) = jobs[index];
+                        futures[EXECUTOR.submit(compileJob, branchReport, compiler, batch, jobOutputDir, workDir)] = index;
+
+                    # Report the results as soon as each job finishes.
+                    jobDurations = {};
+                    for future in concurrent.futures.as_completed(futures):
+                        compilerName = Path(jobs[futures[future]][0]).stem;
+                        (results, jobDurations[futures[future]]) = future.result();
+                        for (file, result) in results.items():
+                            print(result, end='');
+                            recordDiagnostics(compilerName, file, result);
+
+                    # Estimate how long it would've taken to run the jobs in the order they were created in (ie. one compiler at a time,
+                    # and in the same order as the Slice files were found), compared to the order we ran them in, so we can report on it.
+                    branchReport["scheduling"] = {
+                        "makespan": simulateMakespan([jobDurations[i] for i in futures.values()], EXECUTOR._max_workers),
+                        "unorderedMakespan": simulateMakespan([jobDurations[i] for i in range(len(jobs))], EXECUTOR._max_workers),
+                    };
+                    savedTime = branchReport["scheduling"]["unorderedMakespan"] - branchReport["scheduling"]["makespan"];
+                    print("    Running the slowest jobs first saved an estimated " + format(savedTime, ".2f") + "s (" + format(branchReport["scheduling"]["makespan"], ".2f") + "s instead of " + format(branchReport["scheduling"]["unorderedMakespan"], ".2f") + "s).");
+
+                    # Then merge any scratch directories together, in the order that the jobs were created in.
+                    for (_, _, outputDir, jobOutputDir) in jobs:
+                        if jobOutputDir != outputDir:
+                            mergeScratchDir(jobOutputDir, outputDir);
+                else:
+                    for (compiler, batch, _, jobOutputDir) in jobs:
+                        for (file, result) in compileJob(branchReport, compiler, batch, jobOutputDir, workDir)[0].items():
+                            print(result, end='');
+                            recordDiagnostics(Path(compiler).stem, file, result);
+
+                shutil.rmtree(scratchDirBase, ignore_errors=True);
+
+                # Remember how long everything took to compile, for the next time we compile it.
+                with COMPILE_STATS_LOCK:
+                    saveJson(compileStatsPath, COMPILE_STATS);
+
+                # Remember what we generated, so that the next branch can re-use it.
+                if incremental:
+                    incrementalState.clear();
+                    incrementalState["commit"] = runCommand(["git", "-C", workDir, "rev-parse", "HEAD"], "git -C ... rev-parse HEAD", checked=True, capture=True);
+                    incrementalState["files"] = resolvedSliceFiles;
+                    incrementalState["compilers"] = {Path(c).stem: getCompilerCacheKey(c, workDir) for c in workCompilers};
+                    incrementalState["diagnostics"] = {name: {f: d for (f, d) in fileDiagnostics.items() if f in resolvedSliceFiles} for (name, fileDiagnostics) in diagnostics.items()};
+
+                branchReport["phases"]["generate"] = time.perf_counter() - phaseStart;
+
+                # If we're benchmarking, we run all the compilers over all the Slice files a few more times, and store the results
+                # next to the "DIAGNOSTICS" file, so they get committed (and diffed) along with the generated code.
+                if benchmarkRuns != None:
+                    phaseStart = time.perf_counter();
+                    branchReport["benchmark"] = benchmarkCompilers(workCompilers, resolvedSliceFiles, scratchDirBase, workDir);
+                    with open(os.path.join(outputDirBase, "BENCHMARK.json"), "w") as file:
+                        json.dump(branchReport["benchmark"], file, indent=4, sort_keys=True);
+                        file.write("\n");
+                    branchReport["phases"]["benchmark"] = time.perf_counter() - phaseStart;
+                print("    Storing generated code...");
+
+            except subprocess.CalledProcessError as ex:
+                branchReport["phases"].setdefault("build", time.perf_counter() - phaseStart);
+                print("!!!! BUILD FAILURE !!!!")
+                print();
+                print("Skipping code generation phase and moving to the next branch...")
+                # The next branch can't re-use anything from this one, since nothing was generated.
+                incrementalState.clear();
+                writeDiagnostics("\n!!!!!!!!!!!!!!!!!!!!!!!\n!!!! BUILD FAILURE !!!!\n!!!!!!!!!!!!!!!!!!!!!!!\n" + traceback.format_exc().strip());
+
+        return (branchName, branchID, outputDirBase, branchReport);
+
+    # Determines which Slice files need to be re-compiled, because they (or any of the files they include) have changed since the
+    # last branch we generated code for. The code that was generated for the rest of the Slice files is copied out of our scratch
+    # repository into 'outputDirBase', and their diagnostics are loaded from 'incrementalState', so they can be re-used as-is.
+    # Returns a dictionary of which Slice files each compiler needs to compile, and a dictionary of the re-used diagnostics.
+    def planIncrementalGeneration(workDir, resolvedSliceFiles, workCompilers, outputDirBase):
+        compileEverything = ({Path(c).stem: resolvedSliceFiles for c in workCompilers}, {});
+
+        # We can only re-use the previous results if they're what's currently stored in our scratch repository.
+        compareHead = runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD"], "git -C ... rev-parse HEAD", checked=False, capture=True);
+        if compareHead == "" or incrementalState.get("compareHead") != compareHead:
+            print("    No re-usable results from a previous branch, compiling every Slice file...");
+            return compileEverything;
+
+        # Get the blob hash of every Slice file in the repository. We use these to resolve includes, and to key the include cache.
+        blobHashes = {};
+        lsFilesOutput = runCommand(["git", "-C", workDir, "ls-files", "-s", "--", "*.ice"], "git -C ... ls-files -s -- *.ice", checked=True, capture=True);
+        for line in lsFilesOutput.splitlines():
+            (info, path) = line.split("\t", 1);
+            blobHashes[path] = info.split()[1];
+
+        # Returns the names of all the files that 'file' includes, exactly as they're written in its '#include' directives.
+        def getIncludes(file):
+            blobHash = blobHashes.get(file);
+            if blobHash == None:
+                return scanIncludes(os.path.join(workDir, file));
+            if blobHash not in includeCache:
+                includeCache[blobHash] = scanIncludes(os.path.join(workDir, file));
+            return includeCache[blobHash];
+
+        # Returns every file that 'sliceFile' includes (directly or transitively), or `None` if any of its includes can't be resolved.
+        # The compiler resolves every include (even nested ones) with the include directories of the file it was asked to compile
+        # (see 'getSliceCompileArgs'), after first checking the directory of the file that contains the '#include' directive.
+        def getIncludeClosure(sliceFile):
+            parentDir = posixpath.dirname(sliceFile);
+            includeDirs = ["slice", parentDir, posixpath.dirname(parentDir)];
+            closure = set();
+            unvisited = [sliceFile];
+            while len(unvisited) != 0:
+                file = unvisited.pop();
+                for include in getIncludes(file):
+                    candidates = [posixpath.normpath(posixpath.join(d, include)) for d in [posixpath.dirname(file)] + includeDirs];
+                    resolvedInclude = next((c for c in candidates if c in blobHashes), None);
+                    if resolvedInclude == None:
+                        return None;
+                    if resolvedInclude not in closure:
+                        closure.add(resolvedInclude);
+                        unvisited.append(resolvedInclude);
+            return closure;
+
+        # Any file which changed, or which includes a changed file (directly or transitively) must be re-compiled.
+        # If we can't resolve one of a file's includes, we play it safe, and re-compile it too.
+        changedFiles = set(runCommand(["git", "-C", workDir, "diff", "--name-only", incrementalState["commit"], "HEAD", "--", "*.ice"], "git -C ... diff --name-only ...", checked=True, capture=True).splitlines());
+        dirtyFiles = set();
+        for file in resolvedSliceFiles:
+            if file in changedFiles:
+                dirtyFiles.add(file);
+                continue;
+            closure = getIncludeClosure(file);
+            if (closure == None) or not closure.isdisjoint(changedFiles):
+                dirtyFiles.add(file);
+        removedFiles = set(incrementalState["files"]) - set(resolvedSliceFiles);
+        if DEBUGGING: print("    >> dirtyFiles = '" + str(dirtyFiles) + "', removedFiles = '" + str(removedFiles) + "'");
+
+        filesToCompile = {};
+        diagnostics = {};
+        for compiler in workCompilers:
+            compilerName = Path(compiler).stem;
+            # If the compiler itself has changed, or we can't tell which generated files came from which Slice files, it's all or nothing.
+            if (incrementalState["compilers"].get(compilerName) != getCompilerCacheKey(compiler, workDir)) or (compilerName not in incrementalState["diagnostics"]):
+                filesToCompile[compilerName] = resolvedSliceFiles;
+            elif compilerName in SHARED_OUTPUT_COMPILERS:
+                needsCompiling = len(removedFiles) != 0 or any(f in dirtyFiles for f in resolvedSliceFiles);
+                filesToCompile[compilerName] = resolvedSliceFiles if needsCompiling else [];
+            else:
+                filesToCompile[compilerName] = [f for f in resolvedSliceFiles if f in dirtyFiles];
+            if filesToCompile[compilerName] is not resolvedSliceFiles:
+                diagnostics[compilerName] = dict(incrementalState["diagnostics"][compilerName]);
+            print("    " + compilerName + " needs to compile " + str(len(filesToCompile[compilerName])) + " of " + str(len(resolvedSliceFiles)) + " Slice files.");
+
+        # Copy the previously generated code for the compilers we're re-using out of our scratch repository.
+        storedCompilers = runCommand(["git", "-C", compareDir, "ls-tree", "--name-only", "HEAD"], "git -C ... ls-tree --name-only HEAD", checked=True, capture=True).splitlines();
+        reusedCompilers = [name for name in diagnostics if name in storedCompilers];
+        if len(reusedCompilers) != 0:
+            args = ["git", "--git-dir=" + os.path.join(compareDir, ".git"), "--work-tree=" + outputDirBase, "checkout", "HEAD", "--"] + reusedCompilers;
+            runCommand(args, "git --git-dir=... --work-tree=... checkout HEAD -- ...", checked=True, capture=False);
+
+        # Then remove the code that was generated from any Slice files that we're about to re-compile (or which no longer exist).
+        for compilerName in reusedCompilers:
+            if compilerName in SHARED_OUTPUT_COMPILERS:
+                continue;
+            for file in set(filesToCompile[compilerName]) | removedFiles:
+                outputDir = os.path.join(outputDirBase, compilerName, os.path.dirname(file));
+                prefix = Path(file).stem + ".";
+                if os.path.isdir(outputDir):
+                    for entry in os.scandir(outputDir):
+                        if entry.is_file() and entry.name.startswith(prefix):
+                            os.remove(entry.path);
+
+        return (filesToCompile, diagnostics);
+
+    # Holds the message, author, and date of each commit we're going to compare, keyed by both its full and abbreviated IDs.
+    COMMIT_INFO = {};
+
+    # Fetches the message, author, and date of every commit in 'branches' up front, instead of running `git log` for each of them.
+    # We still split them into batches, so we don't run into command-line length limits on Windows.
+    def prefetchCommitInfo(branches):
+        for start in range(0, len(branches), COMMIT_BATCH_SIZE):
+            args = ["git", "log", "--no-walk=unsorted", "--date=raw", "--format=%H%x00%h%x00%an <%ae>%x00%ad%x00%B%x00"] + branches[start : start + COMMIT_BATCH_SIZE];
+            fields = runCommand(args, "git log --no-walk ...", checked=True, capture=True).split("\x00");
+            for i in range(0, len(fields) - 4, 5):
+                info = (fields[i + 4].strip(), fields[i + 2].strip(), fields[i + 3].strip());
+                COMMIT_INFO[fields[i].strip()] = info;
+                COMMIT_INFO[fields[i + 1].strip()] = info;
+
+    # Holds the blob ID and size of every file in the scratch repository's last commit, keyed by path, so that we can tell which
+    # generated files actually changed without asking git about them. Only `MANIFEST["commit"]`'s files are stored at any time.
+    MANIFEST = {"commit": None, "files": {}};
+
+    # Returns the manifest of files in 'commit' of our scratch repository, loading it with 'git ls-tree' if we don't have it already.
+    def getManifest(commit):
+        if commit == "":
+            return {};
+        if MANIFEST["commit"] != commit:
+            files = {};
+            output = runCommand(["git", "-C", compareDir, "ls-tree", "-r", "-l", "-z", "--full-tree", commit], "git -C ... ls-tree -r ...", checked=True, capture=True);
+            for entry in output.split("\0"):
+                if entry.strip() != "":
+                    (info, _, path) = entry.partition("\t");
+                    (mode, type, blobID, size) = info.split();
+                    files[path] = (blobID, int(size));
+            MANIFEST["commit"] = commit;
+            MANIFEST["files"] = files;
+        return MANIFEST["files"];
+
+    # Hashes every file that was generated into 'outputDirBase', and compares them against the manifest of 'parentCommit'.
+    # Returns the manifest of the generated files, and a list of every file that was added, modified, or removed since then
+    # (along with how many bytes it grew or shrank by). 'CHANGES.json' is ignored, since we write it ourselves afterwards.
+    def findChangedFiles(parentCommit, outputDirBase):
+        previousFiles = getManifest(parentCommit);
+        currentFiles = {};
+        changes = [];
+        for (dirPath, dirNames, fileNames) in os.walk(outputDirBase):
+            dirNames.sort();
+            for fileName in sorted(fileNames):
+                filePath = os.path.join(dirPath, fileName);
+                relativePath = os.path.relpath(filePath, outputDirBase).replace('\\', '/');
+                with open(filePath, "rb") as file:
+                    data = file.read();
+                currentFiles[relativePath] = (hashGitBlob(data), len(data));
+                if relativePath not in previousFiles:
+                    changes.append({"path": relativePath, "status": "added", "bytes": len(data)});
+                elif previousFiles[relativePath][0] != currentFiles[relativePath][0]:
+                    changes.append({"path": relativePath, "status": "modified", "bytes": len(data) - previousFiles[relativePath][1]});
+        for (path, (blobID, size)) in sorted(previousFiles.items()):
+            if (path not in currentFiles) and (path != "CHANGES.json"):
+                changes.append({"path": path, "status": "removed", "bytes": -size});
+        return (currentFiles, changes);
+
+    # Summarizes 'changes' by compiler (ie. the top-level directory that each file was generated into).
+    def summarizeChanges(changes):
+        compilerTotals = {};
+        for change in changes:
+            totals = compilerTotals.setdefault(change["path"].split("/")[0], {"added": 0, "modified": 0, "removed": 0, "bytes": 0});
+            totals[change["status"]] += 1;
+            totals["bytes"] += change["bytes"];
+        return compilerTotals;
+
+    # Commits the code that was generated into 'outputDirBase' into our scratch git repository (if anything changed).
+    # Instead of staging the files in a working tree, we stream them straight into the repository's object database with
+    # 'git fast-import', which writes the commit onto a temporary ref. If 'outputDirBase' is `None`, no generated files are
+    # written, and the new commit just carries the previous commit's generated code forward (with a 'CHANGES.json' that lists
+    # no files, so it doesn't look like this commit made the previous commit's changes). Otherwise, only the files which changed
+    # since the previous commit are sent to git, along with a 'CHANGES.json' file which lists them. If no files changed at all,
+    # we don't bother making a commit.
+    def storeGeneratedCode(branchName, branchID, outputDirBase):
+        if storage == "archive":
+            archiveGeneratedCode(branchName, branchID, outputDirBase);
+            return;
+
+        parentCommit = runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD"], "git -C ... rev-parse HEAD", checked=False, capture=True);
+        if outputDirBase == None:
+            (currentFiles, changes) = (dict(getManifest(parentCommit)), []);
+        else:
+            (currentFiles, changes) = findChangedFiles(parentCommit, outputDirBase);
+            if DEBUGGING: print("    >> '" + str(len(changes)) + "' generated files changed since '" + parentCommit + "'");
+            if (parentCommit != "") and (len(changes) == 0):
+                # Generated code in the staging directory isn't removed by `git_clean`, so we delete it as soon as it's been stored.
+                if STAGING_ROOT != None:
+                    shutil.rmtree(outputDirBase, ignore_errors=True);
+                return;
+
+        # Grab various information from whichever commit we just built everything off of.
+        # We want to include this information (message, date, author) in the commits we generate in the scratch repo.
+        # This was normally fetched before we started, but we fetch it now if it wasn't.
+        if branchID not in COMMIT_INFO:
+            prefetchCommitInfo([branchID]);
+        (commitMessage, commitAuthor, commitDate) = COMMIT_INFO[branchID];
+        if DEBUGGING: print("    >> RESULT 'retrieved commit message of '" + commitMessage + "'");
+        if DEBUGGING: print("    >> RESULT 'retrieved commit author of '" + commitAuthor + "'");
+        if DEBUGGING: print("    >> RESULT 'retrieved commit timestamp of '" + commitDate + "'");
+
+        # Construct a new commit message, which contains the message of the original commit (but with any '#' links sanitized),
+        # and with a little header that says which branch and commit the generated code was built off of, with a link to it.
+        # We also clean up its whitespace, the same as `git commit` would.
+        message = branchName + ":(zeroc-ice/ice@" + branchID + ") " + commitMessage.replace("#", "zeroc-ice/ice#");
+        message = "\n".join(line.rstrip() for line in message.splitlines());
+        message = re.sub(r"\n{3,}", "\n\n", message).strip() + "\n";
+
+        # Small imports are normally written as loose objects (one file per object), so we make git always write them as a pack instead.
+        args = ["git", "-C", compareDir, "-c", "fastimport.unpackLimit=0", "fast-import", "--quiet", "--force"];
+        if DEBUGGING: print("    >> Running '" + " ".join(args) + "'");
+        process = subprocess.Popen(args, env=ENVIRONMENT, shell=IS_WINDOWS, stdin=subprocess.PIPE, stdout=OUTPUT_TO);
+        try:
+            def writeData(data):
+                process.stdin.write(b"data " + str(len(data)).encode() + b"\n" + data + b"\n");
+
+            process.stdin.write(b"commit " + IMPORT_REF.encode() + b"\n");
+            process.stdin.write(b"author " + commitAuthor.encode("utf-8") + b" " + commitDate.encode() + b"\n");
+            process.stdin.write(b"committer " + SCRATCH_COMMITTER.encode() + b" " + commitDate.encode() + b"\n");
+            writeData(message.encode("utf-8"));
+            if parentCommit != "":
+                process.stdin.write(b"from " + parentCommit.encode() + b"\n");
+
+            # Only write the files which changed since the previous commit (and delete the ones that were removed).
+            for change in changes:
+                if change["status"] == "removed":
+                    process.stdin.write(b"D " + change["path"].encode("utf-8") + b"\n");
+                else:
+                    with open(os.path.join(outputDirBase, change["path"]), "rb") as file:
+                        process.stdin.write(b"M 100644 inline " + change["path"].encode("utf-8") + b"\n");
+                        writeData(file.read());
+            changesData = json.dumps({"branch": branchName, "commit": branchID, "compilers": summarizeChanges(changes), "files": changes}, indent=4).encode("utf-8") + b"\n";
+            process.stdin.write(b"M 100644 inline CHANGES.json\n");
+            writeData(changesData);
+            currentFiles["CHANGES.json"] = (hashGitBlob(changesData), len(changesData));
+            process.stdin.write(b"\n");
+        finally:
+            process.stdin.close();
+            # Generated code in the staging directory isn't removed by `git_clean`, so we delete it as soon as it's been stored.
+            if (STAGING_ROOT != None) and (outputDirBase != None):
+                shutil.rmtree(outputDirBase, ignore_errors=True);
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, args);
+
+        # Advance our scratch repository's branch to the new commit, and remember which files it has, for the next commit.
+        runCommand(["git", "-C", compareDir, "update-ref", "HEAD", IMPORT_REF], "git -C ... update-ref HEAD ...", checked=True, capture=False);
+        runCommand(["git", "-C", compareDir, "update-ref", "-d", IMPORT_REF], "git -C ... update-ref -d ...", checked=True, capture=False);
+        MANIFEST["commit"] = runCommand(["git", "-C", compareDir, "rev-parse", "HEAD"], "git -C ... rev-parse HEAD", checked=True, capture=True);
+        MANIFEST["files"] = currentFiles;
+
+    # When `--storage=archive` is enabled, this holds the last commit that was archived, so we can tell which compilers' code changed.
+    LAST_ARCHIVED = (loadArchiveIndex(archiveDir)[-1:] or [None])[0] if storage == "archive" else None;
+
+    # Stores the code that was generated into 'outputDirBase' into a zip archive per compiler (ie. per top-level directory), instead of
+    # into our scratch repository, and adds a line for this commit to the archives' index. If a compiler's generated code is exactly the
+    # same as the last commit's, we re-use its archive instead of writing a new one. If 'outputDirBase' is `None`, all of them are re-used.
+    def archiveGeneratedCode(branchName, branchID, outputDirBase):
+        global LAST_ARCHIVED;
+        if branchID not in COMMIT_INFO:
+            prefetchCommitInfo([branchID]);
+        number = 0 if LAST_ARCHIVED == None else LAST_ARCHIVED["number"] + 1;
+        entry = {"number": number, "branch": branchName, "commit": branchID, "subject": COMMIT_INFO[branchID][0].split("\n")[0], "archives": {}, "hashes": {}};
+        entryDir = format(number, "06d") + "_" + branchID;
+
+        if outputDirBase == None:
+            if LAST_ARCHIVED != None:
+                (entry["archives"], entry["hashes"]) = (LAST_ARCHIVED["archives"], LAST_ARCHIVED["hashes"]);
+        else:
+            # Group the generated files by the compiler that generated them, and hash each group, so we can tell if any of it changed.
+            groups = {};
+            for (dirPath, dirNames, fileNames) in os.walk(outputDirBase):
+                dirNames.sort();
+                for fileName in sorted(fileNames):
+                    filePath = os.path.join(dirPath, fileName);
+                    relativePath = os.path.relpath(filePath, outputDirBase).replace('\\', '/');
+                    groups.setdefault(relativePath.split("/")[0], []).append((relativePath, filePath));
+
+            for (name, files) in groups.items():
+                groupHash = hashlib.sha1();
+                for (relativePath, filePath) in files:
+                    with open(filePath, "rb") as file:
+                        groupHash.update(relativePath.encode("utf-8") + b"\0" + hashGitBlob(file.read()).encode() + b"\0");
+                entry["hashes"][name] = groupHash.hexdigest();
+                if (LAST_ARCHIVED != None) and (LAST_ARCHIVED["hashes"].get(name) == entry["hashes"][name]):
+                    entry["archives"][name] = LAST_ARCHIVED["archives"][name];
+                    continue;
+
+                # We write to a temporary file first so that we never leave a half-written archive behind.
+                archivePath = os.path.join(archiveDir, entryDir, name + ".zip");
+                Path(archivePath).parent.mkdir(parents=True, exist_ok=True);
+                with zipfile.ZipFile(archivePath + ".tmp", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                    for (relativePath, filePath) in files:
+                        archive.write(filePath, relativePath);
+                retryOnLockErrors(os.replace, archivePath + ".tmp", archivePath);
+                entry["archives"][name] = entryDir + "/" + name + ".zip";
+            shutil.rmtree(outputDirBase, ignore_errors=True);
+
+        # The index is only ever appended to, so a commit is only part of it once all of its archives have been written.
+        Path(archiveDir).mkdir(parents=True, exist_ok=True);
+        with open(os.path.join(archiveDir, "index.jsonl"), "a") as file:
+            file.write(json.dumps(entry) + "\n");
+        LAST_ARCHIVED = entry;
+
+    # Returns the pathspecs for every file that can affect the generated code: the sources of the compilers, and the Slice files.
+    # Even if only some Slice files are being compiled, they can include Slice files from anywhere in the repository, and the code
+    # generated for them depends on what they include. So we check every Slice file, not only the ones being compiled.
+    def getRelevantPathspecs():
+        return COMPILER_DEPENDENCIES + [("cpp/src/" + Path(c).stem) for c in compilers] + [":(glob)**/*.ice"];
+
+    # Returns true if anything that can affect the generated code has changed between 'previousBranch' and 'branch'.
+    def hasRelevantChanges(previousBranch, branch):
+        args = ["git", "diff", "--name-only", previousBranch, branch, "--"] + RELEVANT_PATHSPECS;
+        changedFiles = runCommand(args, "git diff --name-only <previous> <branch> -- ...", checked=True, capture=True);
+        if DEBUGGING: print("    >> Relevant changes since '" + previousBranch + "' = '" + changedFiles + "'");
+        return changedFiles != "";
+
+    # Records 'branch' in our scratch repository without building anything, because its generated code would be identical
+    # to the previous branch's. We still create an (empty) commit for it, so the scratch repository's history is complete.
+    # Returns the branch's report, just like 'buildAndGenerate' does.
+    def skipUnchangedBranch(branch):
+        branchName = getBranchName(branch);
+        branchID = runCommand(["git", "rev-parse", "--short", branch], "git rev-parse --short <branch>", checked=True, capture=True);
+        print("Skipping '" + branchName + " @ " + branchID + "' since neither the compilers or Slice files have changed...");
+        branchReport = newBranchReport(branchName, branchID);
+        branchReport["skipped"] = True;
+        timePhase(branchReport, "store", storeGeneratedCode, branchName, branchID, None);
+        return branchReport;
+
+    # Returns the hash of every file that was generated for 'commit' (keyed by its path in the generated code), but only the files
+    # that match `--bisect-path`. These are cached in '_slice_cache_' by the commit and compilers that were used, so that bisecting
+    # through the same range again (or with a different path) never has to build and generate the same commit twice.
+    def getGeneratedFileHashes(commit):
+        cacheKey = hashlib.sha256("\0".join([commit] + [Path(c).stem for c in compilers] + sorted(sliceFiles) + includePatterns + ["\0"] + excludePatterns).encode("utf-8")).hexdigest();
+        cachePath = os.path.join(REPO_ROOT, "_slice_cache_", "bisect", cacheKey + ".json");
+        fileHashes = loadJson(cachePath, None);
+        if fileHashes == None:
+            print();
+            print("================================================================================");
+            (_, _, outputDirBase, _) = buildAndGenerate(commit, REPO_ROOT);
+            fileHashes = {};
+            for (dirPath, _, fileNames) in os.walk(outputDirBase):
+                for fileName in fileNames:
+                    filePath = os.path.join(dirPath, fileName);
+                    with open(filePath, "rb") as file:
+                        fileHashes[os.path.relpath(filePath, outputDirBase).replace('\\', '/')] = hashlib.sha1(file.read()).hexdigest();
+            shutil.rmtree(outputDirBase, ignore_errors=True);
+            saveJson(cachePath, fileHashes);
+            print("Finished!");
+            print("================================================================================");
+        else:
+            if DEBUGGING: print("    >> Using cached results for '" + commit + "' from '" + cachePath + "'");
+        return {path: fileHash for (path, fileHash) in fileHashes.items() if fnmatch.fnmatchcase(path, bisectPath)};
+
+    # Binary-searches through the (first-parent) commits in '<good>..<bad>' for the first commit whose generated code (filtered by
+    # `--bisect-path`) differs from the generated code of '<good>', and prints out which commit this was, and which files it changed.
+    def bisectGeneratedCode(bisectRange):
+        (good, bad) = bisectRange.split("..", 1);
+        good = runCommand(["git", "rev-parse", "--verify", good + "^{commit}"], "git rev-parse <good>", checked=True, capture=True);
+        candidates = runCommand(["git", "rev-list", "--first-parent", "--reverse", good + ".." + bad], "git rev-list ... <good>..<bad>", checked=True, capture=True).split();
+        if len(candidates) == 0:
+            print("ERROR: there are no commits between '" + bisectRange + "' to bisect");
+            return;
+
+        goodHashes = getGeneratedFileHashes(good);
+        if getGeneratedFileHashes(candidates[-1]) == goodHashes:
+            print("The generated code (matching '" + bisectPath + "') is the same for both ends of '" + bisectRange + "'.");
+            return;
+
+        # We know the last candidate changed the generated code, so keep halving the range until we find the first that did.
+        (low, high) = (0, len(candidates) - 1);
+        while low < high:
+            print("Bisecting: " + str(high - low) + " commits left to test (roughly " + str((high - low).bit_length()) + " steps)");
+            middle = (low + high) // 2;
+            if getGeneratedFileHashes(candidates[middle]) == goodHashes:
+                low = middle + 1;
+            else:
+                high = middle;
+
+        # Report which files the commit we found changed, compared to the commit before it.
+        firstChanged = candidates[low];
+        (beforeHashes, afterHashes) = (getGeneratedFileHashes(candidates[low - 1] if low != 0 else good), getGeneratedFileHashes(firstChanged));
+        print();
+        print("The first commit that changed the generated code (matching '" + bisectPath + "') is:");
+        print(runCommand(["git", "log", "--no-walk", "--format=%H %s%n    %an <%ae>, %ad", firstChanged], "git log --no-walk <commit>", checked=True, capture=True));
+        print("It changed these generated files:");
+        for path in sorted(set(beforeHashes) | set(afterHashes)):
+            if path not in beforeHashes:
+                print("    added:    " + path);
+            elif path not in afterHashes:
+                print("    removed:  " + path);
+            elif beforeHashes[path] != afterHashes[path]:
+                print("    modified: " + path);
+        print();
+
+    # Generates code for 'oldBranch' and 'newBranch', and compares them file by file, without storing anything in '_slice_compare_'.
+    # Only the files whose hashes differ are actually diffed (in parallel), and everything is written into 'diffDir': the generated
+    # code of each branch (in 'a' and 'b'), a unified diff of every changed file ('DIFF.patch'), and a summary of them ('DIFF.json').
+    # Returns whether the generated code differs between the two branches.
+    def diffGeneratedCode(oldBranch, newBranch):
+        shutil.rmtree(diffDir, ignore_errors=True);
+        Path(diffDir).mkdir(parents=True);
+
+        # Generate the code for each branch, and move it into 'diffDir', so it isn't cleaned up when we build the other branch.
+        branchInfos = [];
+        fileHashes = [];
+        for (branch, side) in [(oldBranch, "a"), (newBranch, "b")]:
+            print();
+            print("================================================================================");
+            (branchName, branchID, outputDirBase, branchReport) = buildAndGenerate(branch, REPO_ROOT);
+            sideDir = os.path.join(diffDir, side);
+            retryOnLockErrors(shutil.move, outputDirBase, sideDir);
+            saveBranchReport(branchReport);
+
+            hashes = {};
+            for (dirPath, _, fileNames) in os.walk(sideDir):
+                for fileName in fileNames:
+                    filePath = os.path.join(dirPath, fileName);
+                    with open(filePath, "rb") as file:
+                        data = file.read();
+                    hashes[os.path.relpath(filePath, sideDir).replace('\\', '/')] = (hashGitBlob(data), len(data));
+            fileHashes.append(hashes);
+            branchInfos.append({"branch": branchName, "commit": branchID});
+            print("Finished!");
+            print("================================================================================");
+
+        # Any files with the same hash are identical, so we only need to diff the ones that were added, removed, or modified.
+        (oldHashes, newHashes) = fileHashes;
+        changes = [];
+        for path in sorted(set(oldHashes) | set(newHashes)):
+            if path not in oldHashes:
+                changes.append({"path": path, "status": "added", "bytes": newHashes[path][1]});
+            elif path not in newHashes:
+                changes.append({"path": path, "status": "removed", "bytes": -oldHashes[path][1]});
+            elif oldHashes[path][0] != newHashes[path][0]:
+                changes.append({"path": path, "status": "modified", "bytes": newHashes[path][1] - oldHashes[path][1]});
+
+        # 'difflib' is pure python, so we diff the files in separate processes, instead of threads, to actually run them in parallel.
+        paths = [change["path"] for change in changes];
+        oldPaths = [(os.path.join(diffDir, "a", path) if path in oldHashes else None) for path in paths];
+        newPaths = [(os.path.join(diffDir, "b", path) if path in newHashes else None) for path in paths];
+        with concurrent.futures.ProcessPoolExecutor(max_workers=(jobCount if jobCount != None else os.cpu_count())) as executor:
+            with open(os.path.join(diffDir, "DIFF.patch"), "w", encoding="utf-8") as patchFile:
+                for diff in executor.map(diffGeneratedFile, paths, oldPaths, newPaths, chunksize=16):
+                    patchFile.write(diff);
+
+        compilerTotals = summarizeChanges(changes);
+        saveJson(os.path.join(diffDir, "DIFF.json"), {"old": branchInfos[0], "new": branchInfos[1], "compilers": compilerTotals, "files": changes});
+
+        print();
+        print("Compared '" + branchInfos[0]["branch"] + " @ " + branchInfos[0]["commit"] + "' with '" + branchInfos[1]["branch"] + " @ " + branchInfos[1]["commit"] + "':");
+        if len(changes) == 0:
+            print("    The generated code is identical.");
+        for (compilerName, totals) in sorted(compilerTotals.items()):
+            print("    " + compilerName + ": " + str(totals["added"]) + " added, " + str(totals["modified"]) + " modified, " + str(totals["removed"]) + " removed (" + format(totals["bytes"], "+d") + " bytes)");
+        print("The full report has been stored in the '" + diffDir + "' directory.");
+        print();
+        return len(changes) != 0;
+
+    # Once a branch is completely finished, we write its report into the report directory (if `--report` is enabled),
+    # and hold onto it, so we can summarize the whole run at the end.
+    def saveBranchReport(branchReport):
+        if reportDir == None:
+            return;
+        saveJson(os.path.join(reportDir, branchReport["commit"] + ".json"), branchReport);
+        BRANCH_REPORTS.append(branchReport);
+
+    # Writes a summary of the whole run into the report directory, and prints out the slowest compilers and Slice files.
+    # When a batch of Slice files was compiled together, we split its cost evenly between the files, since that's all we know.
+    def saveRunReport():
+        if reportDir == None:
+            return;
+        phaseTotals = {};
+        compilerTotals = {};
+        fileTotals = {};
+        csvLines = ["commit,compiler,files,wall,cpu,maxRss"];
+        for branchReport in BRANCH_REPORTS:
+            for (phase, seconds) in branchReport["phases"].items():
+                phaseTotals[phase] = phaseTotals.get(phase, 0) + seconds;
+            for job in branchReport["compiles"]:
+                totals = compilerTotals.setdefault(job["compiler"], {"compiler": job["compiler"], "wall": 0, "cpu": 0, "maxRss": 0, "jobs": 0});
+                totals["wall"] += job["wall"];
+                totals["cpu"] = None if (totals["cpu"] == None or job["cpu"] == None) else totals["cpu"] + job["cpu"];
+                totals["maxRss"] = None if (totals["maxRss"] == None or job["maxRss"] == None) else max(totals["maxRss"], job["maxRss"]);
+                totals["jobs"] += 1;
+                for file in job["files"]:
+                    totals = fileTotals.setdefault(file, {"file": file, "wall": 0, "cpu": 0});
+                    totals["wall"] += job["wall"] / len(job["files"]);
+                    totals["cpu"] = None if (totals["cpu"] == None or job["cpu"] == None) else totals["cpu"] + job["cpu"] / len(job["files"]);
+                csvLines.append(",".join([branchReport["commit"], job["compiler"], " ".join(job["files"]), str(job["wall"]), str(job["cpu"]), str(job["maxRss"])]));
+
+        slowestCompilers = sorted(compilerTotals.values(), key=lambda t: t["wall"], reverse=True);
+        slowestFiles = sorted(fileTotals.values(), key=lambda t: t["wall"], reverse=True);
+        schedulingReports = [branchReport["scheduling"] for branchReport in BRANCH_REPORTS if "scheduling" in branchReport];
+        savedTime = sum(s["unorderedMakespan"] - s["makespan"] for s in schedulingReports);
+        summary = {"phases": phaseTotals, "commands": RUN_COMMANDS, "slowestCompilers": slowestCompilers, "slowestFiles": slowestFiles, "schedulingSavedTime": savedTime};
+        saveJson(os.path.join(reportDir, "summary.json"), summary);
+        with open(os.path.join(reportDir, "compiles.csv"), "w") as file:
+            file.write("\n".join(csvLines) + "\n");
+
+        print("Time spent in each phase:");
+        for (phase, seconds) in sorted(phaseTotals.items(), key=lambda p: p[1], reverse=True):
+            print("    " + phase + ": " + format(seconds, ".2f") + "s");
+        print("Slowest compilers:");
+        for totals in slowestCompilers[:REPORT_SUMMARY_COUNT]:
+            print("    " + totals["compiler"] + ": " + format(totals["wall"], ".2f") + "s over " + str(totals["jobs"]) + " jobs (peak memory " + str(totals["maxRss"]) + " KiB)");
+        print("Slowest Slice files:");
+        for totals in slowestFiles[:REPORT_SUMMARY_COUNT]:
+            print("    " + totals["file"] + ": " + format(totals["wall"], ".2f") + "s");
+        if len(schedulingReports) != 0:
+            print("Running the slowest jobs first saved an estimated " + format(savedTime, ".2f") + "s over " + str(len(schedulingReports)) + " branches.");
+        print("The full report has been stored in the '" + reportDir + "' directory.");
+        print();
+
+
+    # We've finished with a branch, so report on our progress, and repack our scratch repository if too many objects have built up.
+    def finishBranch():
+        global backTrack;
+
+        # Record that this branch is done in the journal, so that if this run is stopped, it can be resumed from the next branch.
+        if storage == "git":
+            journal["completed"] += 1;
+            journal["compareHead"] = runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD"], "git -C ... rev-parse HEAD", checked=False, capture=True);
+            saveJson(JOURNAL_PATH, journal);
+
+        print("Finished!");
+        print("================================================================================");
+        if backTrack != None:
+            print("Backtrack iterations remaining: '" + str(backTrack) + "'");
+            backTrack -= 1;
+        if storage == "git":
+            git_maintain(compareDir);
+
+    # Builds and generates code for multiple branches at once, each in its own worktree, but stores the results in order.
+    # We keep at most 'worktreeCount' branches in flight, and each worktree is re-used for another branch once its results are stored.
+    def processBranchesInWorktrees(branches):
+        freeWorktrees = queue.Queue();
+        for worktreeDir in WORKTREES_DIRS:
+            freeWorktrees.put(worktreeDir);
+
+        def buildInWorktree(branch):
+            worktreeDir = freeWorktrees.get();
+            try:
+                return buildAndGenerate(branch, worktreeDir) + (worktreeDir,);
+            finally:
+                setReportContext(None);
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(WORKTREES_DIRS));
+        try:
+            pending = collections.deque();
+            remainingBranches = iter(branches);
+            previousBranch = [previousComparedBranch];
+            def submitNextBranch():
+                # Branches that we can skip don't need a worktree, so we keep going until we've submitted one that does.
+                for branch in remainingBranches:
+                    canSkip = skipUnchanged and previousBranch[0] != None and not hasRelevantChanges(previousBranch[0], branch);
+                    previousBranch[0] = branch;
+                    if canSkip:
+                        pending.append((branch, None));
+                    else:
+                        pending.append((branch, pool.submit(buildInWorktree, branch)));
+                        return;
 
+            for _ in WORKTREES_DIRS:
+                submitNextBranch();
+            while len(pending) != 0:
+                print();
+                print("================================================================================");
+                (branch, future) = pending.popleft();
+                if future == None:
+                    branchReport = skipUnchangedBranch(branch);
+                    timePhase(branchReport, "finish", finishBranch);
+                    saveBranchReport(branchReport);
+                    continue;
+                (branchName, branchID, outputDirBase, branchReport, worktreeDir) = future.result();
+                timePhase(branchReport, "store", storeGeneratedCode, branchName, branchID, outputDirBase);
+                checkBenchmarkRegressions(branchReport);
+                freeWorktrees.put(worktreeDir);
+                timePhase(branchReport, "finish", finishBranch);
+                saveBranchReport(branchReport);
+                submitNextBranch();
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True);
+
+    # Instead of building branches ourselves, we can hand them out to workers (which can be running on other machines) through a
+    # queue that lives in a shared directory. Each job is a file in the 'jobs' folder, which a worker claims by moving it into the
+    # 'claimed' folder (only one worker can succeed at this). Once it's finished, the worker puts a tarball of the generated code
+    # into the 'results' folder, which we then store into our scratch repository, in order. When we're done, we create a 'STOP' file.
+    def processBranchesWithWorkers(branches):
+        for folder in ["jobs", "claimed", "results"]:
+            shutil.rmtree(os.path.join(coordinatorQueueDir, folder), ignore_errors=True);
+            Path(coordinatorQueueDir, folder).mkdir(parents=True);
+        stopPath = os.path.join(coordinatorQueueDir, "STOP");
+        if os.path.isfile(stopPath):
+            os.remove(stopPath);
+
+        # Workers have their own copies of the repository, so we give them the compilers by name, and the Slice files relative to it.
+        compilerNames = [Path(c).stem for c in compilers];
+        relativeSliceFiles = [os.path.relpath(os.path.join(CURRENT_DIR, f), REPO_ROOT).replace('\\', '/') for f in sliceFiles];
+
+        # Queue up all the branches that we can't skip right away, so the workers can get started on them.
+        plan = [];
+        previousBranch = previousComparedBranch;
+        for (index, branch) in enumerate(branches):
+            canSkip = skipUnchanged and previousBranch != None and not hasRelevantChanges(previousBranch, branch);
+            previousBranch = branch;
+            jobName = format(index, "06d");
+            if not canSkip:
+                commit = runCommand(["git", "rev-parse", "--verify", branch + "^{commit}"], "git rev-parse <branch>", checked=True, capture=True);
+                saveJson(os.path.join(coordinatorQueueDir, "jobs", jobName + ".json"), {"commit": commit, "compilers": compilerNames, "sliceFiles": relativeSliceFiles});
+            plan.append((branch, jobName, canSkip));
+        print("Queued " + str(sum(1 for p in plan if not p[2])) + " branches for the workers in '" + coordinatorQueueDir + "'.");
+
+        # Puts any claimed jobs whose workers have stopped responding back in the queue (see `QUEUE_CLAIM_TIMEOUT`).
+        def requeueStaleClaims():
+            for fileName in os.listdir(os.path.join(coordinatorQueueDir, "claimed")):
+                claimPath = os.path.join(coordinatorQueueDir, "claimed", fileName);
+                try:
+                    if (time.time() - os.path.getmtime(claimPath)) > QUEUE_CLAIM_TIMEOUT:
+                        print("    The worker building job '" + Path(fileName).stem + "' stopped responding, putting it back in the queue...");
+                        os.replace(claimPath, os.path.join(coordinatorQueueDir, "jobs", fileName));
+                except FileNotFoundError:
+                    # The worker finished (or gave up on) the job while we were checking it.
+                    continue;
+
+        try:
+            for (branch, jobName, canSkip) in plan:
+                print();
+                print("================================================================================");
+                if canSkip:
+                    branchReport = skipUnchangedBranch(branch);
+                else:
+                    branchName = getBranchName(branch);
+                    branchID = runCommand(["git", "rev-parse", "--short", branch], "git rev-parse --short <branch>", checked=True, capture=True);
+                    print("Waiting for a worker to finish '" + branchName + " @ " + branchID + "'...");
+                    resultPath = os.path.join(coordinatorQueueDir, "results", jobName);
+                    while not os.path.isfile(resultPath + ".tar.gz"):
+                        requeueStaleClaims();
+                        time.sleep(QUEUE_POLL_INTERVAL);
+
+                    # Unpack the worker's results and store them, just like if we'd generated them ourselves.
+                    branchReport = loadJson(resultPath + ".json", newBranchReport(None, None));
+                    (branchReport["branch"], branchReport["commit"]) = (branchName, branchID);
+                    outputDirBase = os.path.join(STAGING_ROOT if STAGING_ROOT != None else REPO_ROOT, "_slice_gen_" + branchName + "_" + branchID);
+                    with tarfile.open(resultPath + ".tar.gz", "r:gz") as archive:
+                        archive.extractall(outputDirBase, **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}));
+                    timePhase(branchReport, "store", storeGeneratedCode, branchName, branchID, outputDirBase);
+                    checkBenchmarkRegressions(branchReport);
+                    shutil.rmtree(outputDirBase, ignore_errors=True);
+                    os.remove(resultPath + ".tar.gz");
+                    os.remove(resultPath + ".json");
+                timePhase(branchReport, "finish", finishBranch);
+                saveBranchReport(branchReport);
+        finally:
+            # Whether we finished or not, tell the workers to stop, so they don't keep waiting for jobs that'll never come.
+            with open(stopPath, "w"):
+                pass;
+
+    # Runs jobs from the coordinator's queue in 'queueDir' (see `processBranchesWithWorkers`) until the coordinator creates a 'STOP' file.
+    # If we fail to finish a job, we put it back in the queue, so another worker can pick it up instead.
+    def runWorker(queueDir):
+        global compilers, sliceFiles;
+        workerName = socket.gethostname() + "-" + str(os.getpid());
+        print("Waiting for jobs from the coordinator in '" + queueDir + "' as worker '" + workerName + "'...");
+
+        # Workers can be started before the coordinator, so we ignore any 'STOP' file that's left over from an earlier run.
+        startTime = time.time();
+        def shouldStop():
+            stopPath = os.path.join(queueDir, "STOP");
+            return os.path.isfile(stopPath) and (os.path.getmtime(stopPath) >= startTime);
+
+        while not shouldStop():
+            # Try to claim the oldest job that's still in the queue. If another worker beats us to it, we try the next one.
+            (claimPath, jobPath) = (None, None);
+            for fileName in sorted(os.listdir(os.path.join(queueDir, "jobs"))) if os.path.isdir(os.path.join(queueDir, "jobs")) else []:
+                if not fileName.endswith(".json"):
+                    continue;
+                jobPath = os.path.join(queueDir, "jobs", fileName);
+                try:
+                    os.rename(jobPath, os.path.join(queueDir, "claimed", fileName));
+                    claimPath = os.path.join(queueDir, "claimed", fileName);
+                    break;
+                except OSError:
+                    continue;
+            if claimPath == None:
+                time.sleep(QUEUE_POLL_INTERVAL);
+                continue;
+
+            # Renaming the job keeps its old modification time, so we touch it straight away, and then keep touching it from another
+            # thread until we're done, so the coordinator knows we're still working on it. If the coordinator already put the job back
+            # in the queue, then we've lost our claim on it, and go back to waiting.
+            try:
+                os.utime(claimPath);
+            except FileNotFoundError:
+                continue;
+            stopHeartbeat = threading.Event();
+            def sendHeartbeats(claimPath):
+                while not stopHeartbeat.wait(QUEUE_HEARTBEAT_INTERVAL):
+                    try:
+                        os.utime(claimPath);
+                    except OSError:
+                        pass;
+            threading.Thread(target=sendHeartbeats, args=(claimPath,), daemon=True).start();
+
+            try:
+                job = loadJson(claimPath, None);
+                jobName = Path(claimPath).stem;
+                print();
+                print("================================================================================");
+                print("Claimed job '" + jobName + "' for commit '" + job["commit"] + "'");
+
+                # If this is a commit that our copy of the repository doesn't have yet, we have to go and fetch it first.
+                if runCommand(["git", "rev-parse", "--verify", "-q", job["commit"] + "^{commit}"], "git rev-parse <commit>", checked=False, capture=True) == "":
+                    runCommand(["git", "fetch", "--all", "--quiet"], "git fetch --all", checked=True, capture=False);
+
+                compilers = [os.path.join(compilersPath, c) + (".exe" if IS_WINDOWS else "") for c in job["compilers"]];
+                sliceFiles = [os.path.join(REPO_ROOT, f) for f in job["sliceFiles"]];
+                (_, _, outputDirBase, branchReport) = buildAndGenerate(job["commit"], REPO_ROOT);
+                setReportContext(RUN_COMMANDS);
+
+                # Write our report first, so that it's already there by the time the coordinator sees our results.
+                resultPath = os.path.join(queueDir, "results", jobName);
+                saveJson(resultPath + ".json", branchReport);
+                with tarfile.open(resultPath + ".tar.gz.tmp", "w:gz") as archive:
+                    for fileName in sorted(os.listdir(outputDirBase)):
+                        archive.add(os.path.join(outputDirBase, fileName), arcname=fileName);
+                os.replace(resultPath + ".tar.gz.tmp", resultPath + ".tar.gz");
+                shutil.rmtree(outputDirBase, ignore_errors=True);
+                stopHeartbeat.set();
+                try:
+                    os.remove(claimPath);
+                except FileNotFoundError:
+                    # The coordinator thought we'd stopped responding and put the job back in the queue, but our results are still good.
+                    pass;
+                print("Finished!");
+                print("================================================================================");
+            except BaseException:
+                # Put the job back in the queue, unless the coordinator already did that for us (in which case our claim is gone).
+                stopHeartbeat.set();
+                try:
+                    os.replace(claimPath, jobPath);
+                except FileNotFoundError:
+                    pass;
+                raise;
+        print("The coordinator has finished, stopping...");
 
     #### ================================= ####
     #### Let's Actually Do Some Stuff Now! ####
@@ -491,149 +2506,273 @@ if __name__ == "__main__":
     # First, navigate to the repo root. It's easier if we're running in a known location.
     os.chdir(REPO_ROOT);
 
+    # If `--report` is enabled, any commands that aren't part of a specific branch are recorded in here,
+    # and the reports of each branch we've finished are collected in 'BRANCH_REPORTS', so we can summarize them at the end.
+    RUN_COMMANDS = [] if reportDir != None else None;
+    BRANCH_REPORTS = [];
+    setReportContext(RUN_COMMANDS);
+
+    # Branches like 'HEAD~3' are relative to whatever's checked out, so they'd point somewhere else as soon as we checkout the first
+    # branch. So we resolve them now: local branches are kept by name (so they're still checked out and labelled by their name), and
+    # everything else is replaced by the ID of the commit it points at. When back-tracking, catching-up, or resuming, 'branches'
+    # already holds commit IDs, so there's nothing to do.
+    if (backTrack == None) and (resume == False):
+        resolvedBranches = [];
+        for branch in branches:
+            commit = runCommand(["git", "rev-parse", "--verify", "-q", branch + "^{commit}"], "git rev-parse <branch>", checked=False, capture=True);
+            if commit == "":
+                print("ERROR: '" + branch + "' does not refer to a commit");
+                exit(41);
+            branchName = getBranchName(branch);
+            resolvedBranches.append(branchName if branchName != "HEAD" else commit);
+        branches = resolvedBranches;
+        if DEBUGGING: print("    >> (resolved) branches = '" + str(branches) + "'");
+
+    # These are only used when `--skip-unchanged` is enabled, but they're the same for every branch, so compute them once.
+    RELEVANT_PATHSPECS = getRelevantPathspecs();
+    if DEBUGGING: print("    >> RELEVANT_PATHSPECS = '" + str(RELEVANT_PATHSPECS) + "'");
+
     # Then, do a preliminary clean and reset, to make sure we're in a known state.
     git_clean(True);
     git_reset();
 
-    # Create a new directory that we'll use as scratch space for comparing the generated code.
-    Path(compareDir).mkdir(parents=True, exist_ok=True);
-
-    # Initialize a git repository in that directory. We utilize git to do the diffing for us!
-    runCommand(["git", "-C", compareDir, "-c", "init.defaultBranch=master", "init"], "git -C ... init", checked=True, capture=False);
-    runCommand(["git", "-C", compareDir, "config", "user.name", "temp"], "git -C ... config user.name ...", checked=True, capture=False);
-    runCommand(["git", "-C", compareDir, "config", "user.email", "temp@zeroc.com"], "git -C ... config user.email ...", checked=True, capture=False);
-
-    # Then, we want to compile the slice Files against each provided branch, and store them in this scratch git repository.
-    try:
-        for branch in branches:
-            print();
-            print("================================================================================");
-
-            # Checkout the branch, and perform a clean build.
-            git_checkout(branch);
-            git_clean(False);
-
-            # Get the current branch's name and the ID of the commit it's pointing at.
-            branchName = runCommand(["git", "rev-parse", "--abbrev-ref", "HEAD"], None, checked=True, capture=True);
-            branchID = runCommand(["git", "rev-parse", "--short", "HEAD"], None, checked=True, capture=True);
-
-            # Create a directory to store the generated code in after we finish building the compilers in the next step.
-            outputDirBase = os.path.join(REPO_ROOT, "_slice_gen_" + branchName + "_" + branchID);
-            Path(outputDirBase).mkdir();
+    # If we're using a staging directory, create a private directory inside of it for this run to use.
+    STAGING_ROOT = None;
+    if stagingDir != None:
+        STAGING_ROOT = tempfile.mkdtemp(prefix="_slice_staging_", dir=stagingDir);
+        if DEBUGGING: print("    >> Created staging directory '" + STAGING_ROOT + "'");
+
+    def removeStagingRoot():
+        if STAGING_ROOT != None:
+            shutil.rmtree(STAGING_ROOT, ignore_errors=True);
+
+    # If we're bisecting, we search for the first commit that changed the generated code, and then we're done.
+    # We never touch our scratch repository while bisecting, so we skip all the setup that's needed for it.
+    if bisectRange != None:
+        try:
+            bisectGeneratedCode(bisectRange);
+        except KeyboardInterrupt:
+            print("Cancellation requested: performing a quick cleanup (takes around 1 second)");
+        removeStagingRoot();
+        git_clean(False);
+        git_checkout(ORIGINAL_BRANCH);
+        exit(0);
+
+    # If we're only diffing two branches, we generate code for both of them, write a report of their differences, and then we're done.
+    # If the generated code differs, we exit with a non-zero code, so that this can be used as a check.
+    if diffOnly:
+        codeDiffers = False;
+        try:
+            codeDiffers = diffGeneratedCode(branches[0], branches[1]);
+            saveRunReport();
+        except KeyboardInterrupt:
+            print("Cancellation requested: performing a quick cleanup (takes around 1 second)");
+        removeStagingRoot();
+        git_clean(False);
+        git_checkout(ORIGINAL_BRANCH);
+        exit(33 if codeDiffers else 0);
+
+    # If we're a worker, we build whatever commits the coordinator puts in its queue, until it tells us to stop.
+    # Like when bisecting, we never touch our own scratch repository, the coordinator stores everything in its own.
+    if workerQueueDir != None:
+        try:
+            runWorker(workerQueueDir);
+        except KeyboardInterrupt:
+            print("Cancellation requested: performing a quick cleanup (takes around 1 second)");
+        removeStagingRoot();
+        git_clean(False);
+        git_checkout(ORIGINAL_BRANCH);
+        exit(0);
+
+    # Create a new directory that we'll use as scratch space for comparing the generated code (unless we're storing it in archives).
+    # Then initialize a git repository in that directory. We utilize git to do the diffing for us!
+    if storage == "git":
+        Path(compareDir).mkdir(parents=True, exist_ok=True);
+        runCommand(["git", "-C", compareDir, "-c", "init.defaultBranch=master", "init"], "git -C ... init", checked=True, capture=False);
+        runCommand(["git", "-C", compareDir, "config", "user.name", "temp"], "git -C ... config user.name ...", checked=True, capture=False);
+        runCommand(["git", "-C", compareDir, "config", "user.email", "temp@zeroc.com"], "git -C ... config user.email ...", checked=True, capture=False);
+
+    # Returns a new journal for a run that compares 'branches'.
+    def startJournal(branches):
+        return {
+            "branches": branches,
+            "completed": 0,
+            "compareHead": runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD"], "git -C ... rev-parse HEAD", checked=False, capture=True),
+            "compilers": [Path(c).stem for c in compilers],
+            "sliceFiles": [os.path.relpath(os.path.join(CURRENT_DIR, f), REPO_ROOT) for f in sliceFiles],
+            "backTrack": backTrack != None,
+        };
+
+    # Unless we're resuming a run (in which case we keep using its journal), start a new journal for this run.
+    # When watching, each batch of new commits gets its own journal instead, once we know which commits they are.
+    # Archives don't keep a journal, since they can't be resumed anyways.
+    if storage == "git":
+        if journal == None:
+            journal = startJournal(branches);
+        if watchBranch == None:
+            saveJson(JOURNAL_PATH, journal);
+
+    # Fetch the information we need about every commit we're going to compare, all at once.
+    prefetchCommitInfo(branches);
+
+    # If we're using worktrees, create them now. Any worktrees left over from a cancelled run are re-used.
+    def removeWorktrees():
+        for worktreeDir in WORKTREES_DIRS:
+            git_worktree_remove(worktreeDir);
+        shutil.rmtree(os.path.join(REPO_ROOT, "_slice_worktrees_"), ignore_errors=True);
+
+    WORKTREES_DIRS = [];
+    if worktreeCount != None:
+        runCommand(["git", "worktree", "prune"], None, checked=True, capture=False);
+        for i in range(worktreeCount):
+            worktreeDir = os.path.join(REPO_ROOT, "_slice_worktrees_", str(i));
+            if not os.path.isdir(worktreeDir):
+                git_worktree_add(worktreeDir);
+            WORKTREES_DIRS.append(worktreeDir);
+
+    # If we're generating code incrementally, load whatever we remembered from the last time we ran.
+    incrementalState = loadJson(incrementalStatePath, {}) if incremental else {};
+    includeCache = loadJson(includeCachePath, {}) if incremental else {};
+
+    # After storing a branch's generated code, we remember which commit of our scratch repository the generated code is stored in.
+    # This way, if anything else touches the scratch repository in the meantime, we know we can't re-use the results anymore.
+    def saveIncrementalState():
+        if len(incrementalState) != 0:
+            incrementalState["compareHead"] = runCommand(["git", "-C", compareDir, "rev-parse", "--verify", "-q", "HEAD"], "git -C ... rev-parse HEAD", checked=False, capture=True);
+        saveJson(incrementalStatePath, incrementalState);
+        saveJson(includeCachePath, includeCache);
+
+    # When benchmarking, each branch's results are compared against the previous branch's. If we're catching-up, the first
+    # branch is compared against whichever results were stored in our scratch repository last time.
+    previousBenchmark = None;
+    if benchmarkRuns != None:
+        storedBenchmark = runCommand(["git", "-C", compareDir, "show", "HEAD:BENCHMARK.json"], "git -C ... show HEAD:BENCHMARK.json", checked=False, capture=True);
+        if storedBenchmark.startswith("{"):
+            previousBenchmark = json.loads(storedBenchmark);
+    BENCHMARK_REGRESSIONS = [];
+
+    # Compiles the Slice files against each of 'branches', and stores the results in our scratch git repository (in order).
+    def processBranches(branches):
+        if coordinatorQueueDir != None:
+            processBranchesWithWorkers(branches);
+        elif worktreeCount != None:
+            processBranchesInWorktrees(branches);
+        else:
+            previousBranch = previousComparedBranch;
+            for branch in branches:
+                print();
+                print("================================================================================");
+                if skipUnchanged and previousBranch != None and not hasRelevantChanges(previousBranch, branch):
+                    branchReport = skipUnchangedBranch(branch);
+                else:
+                    (branchName, branchID, outputDirBase, branchReport) = buildAndGenerate(branch, REPO_ROOT);
+                    timePhase(branchReport, "store", storeGeneratedCode, branchName, branchID, outputDirBase);
+                    checkBenchmarkRegressions(branchReport);
+                    setReportContext(RUN_COMMANDS);
+                if incremental:
+                    saveIncrementalState();
+                timePhase(branchReport, "finish", finishBranch);
+                saveBranchReport(branchReport);
+                previousBranch = branch;
 
-            # And also go ahead and resolve which Slice files we should compile from this branch.
-            resolvedSliceFiles = resolveSliceFiles(sliceFiles);
+        # Finally, we do a hard reset on our now fully completed scratch git repository,
+        # so that it doesn't look like all it's files were deleted when you interact with it.
+        if storage == "git":
+            runCommand(["git", "-C", compareDir, "reset", "--hard"], "git -C ... reset --hard", checked=True, capture=False);
+            # Now that every branch is finished, there's nothing left to resume.
+            os.remove(JOURNAL_PATH);
+
+    # Waits for new commits to show up on 'watchBranch', and compares them as soon as they do, the same as catch-up mode would.
+    # If 'watchBranch' is a remote-tracking branch, we fetch its remote before every check. This only returns if it's cancelled.
+    # Because this process never exits, the Slice files we've listed stay in memory, and the compilers we've built stay in the build cache.
+    def watchForCommits(watchBranch):
+        global backTrack, journal, previousComparedBranch;
+        fullName = runCommand(["git", "rev-parse", "--symbolic-full-name", watchBranch], "git rev-parse --symbolic-full-name <branch>", checked=True, capture=True);
+        remote = fullName.split("/")[2] if fullName.startswith("refs/remotes/") else None;
+
+        previousComparedBranch = getLastComparedCommit();
+        isWaiting = False;
+        while True:
+            if remote != None:
+                runCommand(["git", "fetch", "--quiet", remote], "git fetch <remote>", checked=False, capture=False);
+            tip = runCommand(["git", "rev-parse", "--verify", "-q", watchBranch + "^{commit}"], "git rev-parse <branch>", checked=False, capture=True);
+
+            if tip == "":
+                newBranches = [];
+                print("WARNING: '" + watchBranch + "' does not exist, continuing anyways...");
+            # If we haven't compared anything yet, we start with whatever commit the branch is currently on.
+            elif previousComparedBranch == None:
+                newBranches = [tip];
+            else:
+                newBranches = getCommitsSince(previousComparedBranch, tip);
 
-            # Build the compilers so we can run them.
-            outputString = "";
-            try:
-                print("Building '" + branchName + " @ " + branchID + "'...");
-                if DEBUGGING: print("--------------------------------------------------------------------------------");
-                build(compilers, projPath);
-                if DEBUGGING: print("--------------------------------------------------------------------------------");
-                print("Build complete!");
-
-                # Run all the Slice compilers!
-                for compiler in compilers:
-                    compilerName = Path(compiler).stem;
-                    print("    Running " + compilerName + "...");
-                    compilerOutputDir = os.path.join(outputDirBase, compilerName);
+            if len(newBranches) != 0:
+                print();
+                print("Found " + str(len(newBranches)) + " new commits on '" + watchBranch + "'.");
+                backTrack = len(newBranches) - 1;
+                journal = startJournal(newBranches);
+                saveJson(JOURNAL_PATH, journal);
+                prefetchCommitInfo(newBranches);
+                processBranches(newBranches);
+                previousComparedBranch = newBranches[-1];
+                print();
+                saveRunReport();
+                isWaiting = False;
 
-                    # Ironically, we cannot run 'slice2py' in parallel, since multiple files read/write to a single "__init__.py" file.
-                    # We also cannot run java or matlab, since they hit race conditions when generating directories.
-                    if runInParallel and compilerName not in ["slice2py", "slice2java", "slice2matlab"]:
-                        futures = [
-                            EXECUTOR.submit(sliceCompile, compiler, "./" + file, os.path.join(compilerOutputDir, os.path.dirname(file))) for file in resolvedSliceFiles
-                        ];
-                        for future in futures:
-                            result = future.result();
-                            outputString += result;
-                            print(result, end='');
-                    else:
-                        for file in resolvedSliceFiles:
-                            outputDir = os.path.join(compilerOutputDir, os.path.dirname(file));
-                            result = sliceCompile(compiler, "./" + file, outputDir);
-                            outputString += result;
-                            print(result, end='');
+            if not isWaiting:
+                print("Waiting for new commits on '" + watchBranch + "' (checking every " + str(pollInterval) + " seconds)...");
+                isWaiting = True;
+            time.sleep(pollInterval);
 
-                print("    Storing generated code...");
-            except subprocess.CalledProcessError as ex:
-                print("!!!! BUILD FAILURE !!!!")
-                print();
-                print("Skipping code generation phase and moving to the next branch...")
-                outputString += "\n!!!!!!!!!!!!!!!!!!!!!!!\n!!!! BUILD FAILURE !!!!\n!!!!!!!!!!!!!!!!!!!!!!!\n" + traceback.format_exc().strip();
-
-            # If there were any diagnostics produced during the build/code-gen phases, write them into the "DIAGNOSTICS" file.
-            with open(os.path.join(outputDirBase, "DIAGNOSTICS"), "w") as errorFile:
-                errorFile.write(outputString.replace(REPO_ROOT, "REPO_ROOT"));
-
-            # Now that we've generated all the code we care about into this '_slice_gen_*' folder,
-            # We rip out the core '.git' folder from our scratch repo, and move into this '_slice_gen_*' folder.
-            moveDir(os.path.join(compareDir, ".git"), outputDirBase);
-
-            # Check if there's been any changes to the generated code. If there have been, we want to add and commit them.
-            # We have this check because if there are no changes, `git commit` 'fails' with a non-zero exit code.
-            result = runCommand(["git", "-C", outputDirBase, "status", "-s"], "git -C ... status -s", checked=True, capture=True);
-            if result != "":
-                # Grab various information from whichever commit we just built everything off of.
-                # We want to include this information (message, date, author) in the commits we generate in the scratch repo.
-                commitMessage = runCommand(["git", "log", "--format=%B", "-n", "1"], None, checked=True, capture=True);
-                if DEBUGGING: print("    >> RESULT 'retrieved commit message of '" + commitMessage + "'");
-                commitAuthor = runCommand(["git", "log", "--format=%an <%ae>", "-n", "1"], None, checked=True, capture=True);
-                if DEBUGGING: print("    >> RESULT 'retrieved commit author of '" + commitAuthor + "'");
-                commitDate = runCommand(["git", "log", "--format=%ad", "-n", "1"], None, checked=True, capture=True);
-                if DEBUGGING: print("    >> RESULT 'retrieved commit timestamp of '" + commitDate + "'");
-
-                # Construct a new commit message, which contains the message of the original commit (but with any '#' links sanitized),
-                # and with a little header that says which branch and commit the generated code was built off of, with a link to it.
-                message = branchName + ":(zeroc-ice/ice@" + branchID + ") " + commitMessage.replace("#", "zeroc-ice/ice#");
-
-                # We commit the contents of this '_slice_gen_*' folder, so that the '.git' will capture it.
-                ENVIRONMENT["GIT_COMMITTER_DATE"] = commitDate;
-                ENVIRONMENT["GIT_AUTHOR_DATE"] = commitDate;
-                runCommand(["git", "-C", outputDirBase, "add", "--all"], "git -C ... add --all", checked=True, capture=False);
-                runCommand(["git", "-C", outputDirBase, "commit", "--author=" + commitAuthor, "-m", message], "git -C ... commit ...", checked=True, capture=False);
-                del ENVIRONMENT["GIT_COMMITTER_DATE"];
-                del ENVIRONMENT["GIT_AUTHOR_DATE"];
-
-            # Now that we've captured any changes in the generated code, move the '.git' back to where it belongs,
-            moveDir(os.path.join(outputDirBase, ".git"), compareDir);
-
-            # We're done with this branch!
-            print("Finished!");
-            print("================================================================================");
-            if backTrack != None:
-                print("Backtrack iterations remaining: '" + str(backTrack) + "'");
-                backTrack -= 1;
+    # When watching, we want to clean up properly when we're stopped by a service manager too, not only with Ctrl+C.
+    def raiseKeyboardInterrupt(signalNumber, frame):
+        raise KeyboardInterrupt();
+    if (watchBranch != None) and not IS_WINDOWS:
+        signal.signal(signal.SIGTERM, raiseKeyboardInterrupt);
 
-                # Check if enough cycles have passed yet to warrant a repack of the scratch repository.
-                # The `+2` is because we don't want to repack at `backTrack==0`, since we already repack at the end of the script.
-                if ((backTrack+2) % REPACK_COUNTER_MAX == 0):
-                    git_repack(compareDir);
+    # Then, we want to compile the slice Files against each provided branch, and store them in this scratch git repository.
+    try:
+        if watchBranch != None:
+            watchForCommits(watchBranch);
+        processBranches(branches);
 
-        # Finally, we do a hard reset on our now fully completed scratch git repository,
-        # so that it doesn't look like all it's files were deleted when you interact with it.
-        runCommand(["git", "-C", compareDir, "reset", "--hard"], "git -C ... reset --hard", checked=True, capture=False);
-        # And do a final packing/garbage collection pass to keep file sizes down.
-        git_repack(compareDir);
+        # And do a final packing pass to keep file sizes down. A full garbage collection is only run if it was asked for.
+        if storage == "git":
+            git_maintain(compareDir, force=True);
+            if aggressiveGc:
+                git_gc(compareDir);
 
         print();
-        print("The results of this script have been stored in the '" + compareDir + "' directory.");
+        saveRunReport();
+
+        print("The results of this script have been stored in the '" + (compareDir if storage == "git" else archiveDir) + "' directory.");
         print();
 
         # Okay, now the actual last step, we do a final clean to remove everything except the new git repository we created,
         # And switch back to the branch that this repository was on originally, to minimize inconvenience for users.
         if DEBUGGING: print("    >> Running final cleanup logic now");
+        removeStagingRoot();
+        removeWorktrees();
         git_clean(False);
         git_checkout(ORIGINAL_BRANCH);
+
+        # If any of the compilers got slower (or hungrier) than `--benchmark-threshold` allows, we fail the run.
+        if len(BENCHMARK_REGRESSIONS) != 0:
+            print("ERROR: the following benchmark regressions were found:");
+            for regression in BENCHMARK_REGRESSIONS:
+                print("    " + regression);
+            exit(22);
     except KeyboardInterrupt:
+
         # If the script was cancelled, and we're not trying to debug it, cleanup what we were doing before exiting.
+        # Note that we don't need to worry about our scratch repository, 'storeGeneratedCode' never leaves it half-written.
         if not DEBUGGING:
             print("Cancellation requested: performing a quick cleanup (takes around 1 second)")
             time.sleep(0.5);
-            if outputDirBase:
-                tempGitPath = os.path.join(outputDirBase, ".git");
-                if os.path.exists(tempGitPath):
-                    moveDir(tempGitPath, compareDir);
+            removeStagingRoot();
+            removeWorktrees();
             git_clean(False);
             git_checkout(ORIGINAL_BRANCH);
+        if (storage == "git") and os.path.isfile(JOURNAL_PATH):
+            print("To pick up where this run left off, run this script again with '--resume'.");
+